@@ -0,0 +1,273 @@
+import argparse
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import pandas as pd
+import requests
+from bs4 import BeautifulSoup
+
+from data_collector import BACKOFF_SECONDS, MAX_RETRIES, RETRY_STATUS_CODES, RateLimiter, make_session
+from price_cleaning import CANONICAL_COLUMNS, canonicalize
+from price_dataset import RECORD_KEY_COLUMNS
+
+# --- Configuration ---
+# Price report the Agmarknet search form opens; overridable so the scraper can be pointed at a stub server
+REPORT_URL = os.getenv("AGMARKNET_REPORT_URL", "https://agmarknet.gov.in/SearchCmmMkt.aspx")
+REPORT_DATE_FORMAT = '%d-%b-%Y' # DateFrom/DateTo in the report URL, e.g. 01-Aug-2025
+# Codes the report expects for the names we scrape; other values can be passed on the command line
+COMMODITY_CODES = {'Wheat': '1'}
+STATE_CODES = {'Uttar Pradesh': 'UP', 'Madhya Pradesh': 'MP'}
+ALL_MARKETS = '0' # Market code selecting every market of the state
+
+CHUNK_DAYS = 31 # Each job covers at most this many days, so report pages stay small
+MAX_WORKERS = 4 # Reports fetched concurrently
+REQUESTS_PER_SECOND = 1.0 # Shared across all workers; the site is slow and rate limits aggressively
+PARTS_DIR = "agmarknet_parts" # One cleaned CSV per finished job; doubles as the resume checkpoint
+
+ScrapeJob = namedtuple('ScrapeJob', ['commodity', 'state', 'market', 'date_from', 'date_to'])
+
+
+def date_chunks(start, end, chunk_days=CHUNK_DAYS):
+    """
+    Splits the inclusive date range [start, end] into consecutive (from, to) ranges of at most chunk_days days.
+    """
+    chunks = []
+    while start <= end:
+        chunk_end = min(start + timedelta(days=chunk_days - 1), end)
+        chunks.append((start, chunk_end))
+        start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def plan_jobs(commodity, state, markets, start, end, chunk_days=CHUNK_DAYS):
+    """
+    Returns one job per market code and date chunk.
+    """
+    return [
+        ScrapeJob(commodity, state, market, date_from, date_to)
+        for market in markets
+        for date_from, date_to in date_chunks(start, end, chunk_days)
+    ]
+
+
+def job_name(job):
+    """
+    Returns a filename-safe name for a job, used for its part file and its fixture.
+    """
+    name = f"{job.commodity}_{job.state}_{job.market}_{job.date_from:%Y-%m-%d}_{job.date_to:%Y-%m-%d}"
+    return re.sub(r'[^A-Za-z0-9_.-]+', '-', name)
+
+
+def report_params(job, commodity_code, state_code):
+    """
+    Returns the query parameters of the price report for a job, as the site's search form sends them.
+    """
+    date_from = job.date_from.strftime(REPORT_DATE_FORMAT)
+    date_to = job.date_to.strftime(REPORT_DATE_FORMAT)
+    return {
+        'Tx_Commodity': commodity_code,
+        'Tx_State': state_code,
+        'Tx_District': '0',
+        'Tx_Market': job.market,
+        'DateFrom': date_from,
+        'DateTo': date_to,
+        'Fr_Date': date_from,
+        'To_Date': date_to,
+        'Tx_Trend': '0', # Prices rather than arrivals
+        'Tx_CommodityHead': job.commodity,
+        'Tx_StateHead': job.state,
+        'Tx_DistrictHead': '--Select--',
+        'Tx_MarketHead': '--Select--',
+    }
+
+
+def fetch_report(session, limiter, url, params):
+    """
+    Fetches one report page, retrying with exponential backoff on network errors,
+    rate limiting (429) and server errors, like data_collector.fetch_page. Returns the HTML.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.wait()
+        delay = BACKOFF_SECONDS * (2 ** attempt)
+        try:
+            response = session.get(url, params=params, timeout=60)
+            if response.status_code not in RETRY_STATUS_CODES:
+                response.raise_for_status()
+                return response.text
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            error = f"HTTP {response.status_code}"
+        except requests.exceptions.HTTPError:
+            raise
+        except requests.exceptions.RequestException as req_err:
+            error = str(req_err)
+
+        if attempt < MAX_RETRIES:
+            time.sleep(delay)
+    raise requests.exceptions.RetryError(f"Giving up on {params['DateFrom']}..{params['DateTo']} after {MAX_RETRIES} retries: {error}")
+
+
+def parse_report(html, state=None):
+    """
+    Extracts the price table of a report page into the canonical cleaned schema
+    (see price_cleaning.canonicalize). The table is the one whose header names a
+    modal price; pages without one ("No Data Found") give an empty frame.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    for table in soup.find_all('table'):
+        rows = table.find_all('tr')
+        if not rows:
+            continue
+        header = [cell.get_text(' ', strip=True) for cell in rows[0].find_all(['th', 'td'])]
+        if not any('modal' in name.lower() for name in header):
+            continue
+        records = []
+        for row in rows[1:]:
+            cells = [cell.get_text(' ', strip=True) for cell in row.find_all('td')]
+            if len(cells) == len(header): # Skips pager and footer rows
+                records.append(cells)
+        return canonicalize(pd.DataFrame(records, columns=header), state=state)
+    return pd.DataFrame(columns=CANONICAL_COLUMNS)
+
+
+def run_job(job, fetch_html, parts_dir):
+    """
+    Fetches and parses one job, then writes its rows to its part file. The file is
+    written under a temporary name and renamed, so it only exists once the job is done.
+    Returns the number of rows.
+    """
+    df = parse_report(fetch_html(job), state=job.state)
+    path = os.path.join(parts_dir, job_name(job) + '.csv')
+    df.to_csv(path + '.tmp', index=False, date_format='%Y-%m-%d')
+    os.replace(path + '.tmp', path)
+    return len(df)
+
+
+def scrape(jobs, fetch_html, parts_dir=PARTS_DIR, workers=MAX_WORKERS):
+    """
+    Runs the jobs on a pool of `workers` threads. Jobs whose part file already exists are
+    skipped, so an interrupted or partly failed run picks up where it stopped.
+    Returns (rows scraped in this run, failed jobs).
+    """
+    os.makedirs(parts_dir, exist_ok=True)
+    pending = [job for job in jobs if not os.path.exists(os.path.join(parts_dir, job_name(job) + '.csv'))]
+    if len(pending) < len(jobs):
+        print(f"Resuming: {len(jobs) - len(pending)} of {len(jobs)} jobs already done.")
+
+    rows = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, job, fetch_html, parts_dir): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                count = future.result()
+            except Exception as e:
+                print(f"  Error scraping {job_name(job)}: {e}")
+                failed.append(job)
+                continue
+            rows += count
+            print(f"  Scraped {count} rows for {job_name(job)}")
+    return rows, failed
+
+
+def combine_parts(jobs, parts_dir, output_path):
+    """
+    Concatenates the part files of the given jobs into one cleaned CSV, sorted by date,
+    with rows repeated across overlapping jobs dropped. Returns the number of rows written.
+    """
+    paths = [os.path.join(parts_dir, job_name(job) + '.csv') for job in jobs]
+    frames = [pd.read_csv(path, dtype=str) for path in paths if os.path.exists(path)]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=CANONICAL_COLUMNS)
+    df = df.drop_duplicates(subset=RECORD_KEY_COLUMNS).sort_values(['Date', 'District', 'Market'], kind='stable')
+    df.to_csv(output_path, index=False)
+    return len(df)
+
+
+def fixture_fetcher(fixtures_dir):
+    """
+    Returns a fetch function that replays saved report pages, <job name>.html in fixtures_dir, instead of the site.
+    """
+    def fetch_html(job):
+        with open(os.path.join(fixtures_dir, job_name(job) + '.html'), encoding='utf-8') as f:
+            return f.read()
+    return fetch_html
+
+
+def live_fetcher(url, commodity_code, state_code, workers, rate, save_dir=None):
+    """
+    Returns (fetch function reading report pages from the site, its session). Pages are also
+    saved to save_dir as fixtures when it is given.
+    """
+    session = make_session(workers)
+    limiter = RateLimiter(rate)
+
+    def fetch_html(job):
+        html = fetch_report(session, limiter, url, report_params(job, commodity_code, state_code))
+        if save_dir:
+            with open(os.path.join(save_dir, job_name(job) + '.html'), 'w', encoding='utf-8') as f:
+                f.write(html)
+        return html
+    return fetch_html, session
+
+
+# --- Command line interface ---
+# Example: python agmarknet_scraper.py --state "Uttar Pradesh" --from 2025-08-01 --to 2025-08-31
+# Offline: add --fixtures fixtures/agmarknet to replay saved pages instead of fetching them
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scrape Agmarknet price reports into a cleaned CSV.")
+    parser.add_argument('--commodity', default='Wheat')
+    parser.add_argument('--state', default='Uttar Pradesh')
+    parser.add_argument('--markets', default=ALL_MARKETS, help=f"Comma-separated market codes (default: {ALL_MARKETS}, all markets)")
+    parser.add_argument('--from', dest='date_from', required=True, help="First date, YYYY-MM-DD")
+    parser.add_argument('--to', dest='date_to', required=True, help="Last date, YYYY-MM-DD")
+    parser.add_argument('--commodity-code', help="Report code of the commodity (default: from COMMODITY_CODES)")
+    parser.add_argument('--state-code', help="Report code of the state (default: from STATE_CODES)")
+    parser.add_argument('--chunk-days', type=int, default=CHUNK_DAYS, help=f"Days per job (default: {CHUNK_DAYS})")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND, help="Max requests per second")
+    parser.add_argument('--url', default=REPORT_URL, help="Report endpoint (e.g. a local stub server)")
+    parser.add_argument('--fixtures', help="Replay saved report pages from this directory instead of the site")
+    parser.add_argument('--save-fixtures', help="Also save every fetched page to this directory")
+    parser.add_argument('--parts-dir', default=PARTS_DIR, help=f"Per-job results and resume state (default: {PARTS_DIR})")
+    parser.add_argument('--output', help="Cleaned CSV to write (default: named after the commodity, state and dates)")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.date_from, '%Y-%m-%d').date()
+    end = datetime.strptime(args.date_to, '%Y-%m-%d').date()
+    jobs = plan_jobs(args.commodity, args.state, args.markets.split(','), start, end, args.chunk_days)
+    output_path = args.output or (
+        f"scraped_agmarknet_{args.commodity.lower().replace(' ', '_')}_{args.state.lower().replace(' ', '_')}"
+        f"_{start:%Y%m%d}_{end:%Y%m%d}.csv"
+    )
+
+    session = None
+    if args.fixtures:
+        fetch_html = fixture_fetcher(args.fixtures)
+    else:
+        commodity_code = args.commodity_code or COMMODITY_CODES.get(args.commodity)
+        state_code = args.state_code or STATE_CODES.get(args.state)
+        if not commodity_code or not state_code:
+            parser.error("Unknown commodity or state code; pass --commodity-code and --state-code.")
+        if args.save_fixtures:
+            os.makedirs(args.save_fixtures, exist_ok=True)
+        fetch_html, session = live_fetcher(args.url, commodity_code, state_code, args.workers, args.rate, args.save_fixtures)
+
+    print(f"Scraping {len(jobs)} jobs ({args.commodity}, {args.state}, {start} to {end}) with {args.workers} workers...")
+    started = time.perf_counter()
+    try:
+        rows, failed = scrape(jobs, fetch_html, args.parts_dir, args.workers)
+    finally:
+        if session is not None:
+            session.close()
+    print(f"Scraped {rows} rows in {time.perf_counter() - started:.1f}s")
+    if failed:
+        print(f"{len(failed)} jobs failed; run the same command again to retry them.")
+
+    total = combine_parts(jobs, args.parts_dir, output_path)
+    print(f"Wrote {total} cleaned rows to {output_path}")
@@ -1,64 +1,640 @@
-from flask import Flask, request, jsonify, send_from_directory # Import send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory # Import send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+import numpy as np
 import pandas as pd
-from prophet import Prophet
-import joblib
 from datetime import datetime, timedelta
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import copy
+import hashlib
 import os
+import threading
+import time
+from fallback_model import FallbackForecaster
+from forecast_cache import ForecastCache, model_fingerprint
+from forecast_engine import DEFAULT_INTERVAL_SAMPLES, INTERVAL_METHODS, ForecastEngine
+from forecast_table import FORECAST_TABLE_FILENAME, ForecastTable
+from history_store import HISTORY_DB_FILENAME, HISTORY_FREQUENCIES, HISTORY_KEY_COLUMNS, HistoryStore
+from model_registry import ModelRegistry, ModelWatcher, load_model_file, parse_model_filename
+from model_store import MODEL_STORE_FILENAME, open_model_store
+from options_index import OPTION_FIELDS, OptionsIndex
+from serving_metrics import (
+    PROMETHEUS_CONTENT_TYPE, Metrics, profile_stages, server_timing, start_profile, timed_stage,
+)
+
+# orjson is listed in requirements.txt and encodes responses in production; without it
+# (e.g. a minimal dev install) they fall back to the slower json module, with the same output
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with orjson when it is available, keeping jsonify's sorted keys.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get('indent'): # Pretty-printed debug output stays on the json module
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_SORT_KEYS).decode()
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app) # Allow CORS for all routes and all origins for local development
 
-# --- Load all trained Prophet models ---
-TRAINED_MODELS = {}
+# --- Index the trained Prophet models ---
+# Only filenames are read at startup; each model is loaded on its first request.
+# Models are served by the NumPy ForecastEngine; only pickled models it cannot handle use Prophet.predict.
+# Markets with too little history for Prophet are served by a FallbackForecaster (see fallback_model.py).
 MODEL_DIR = "." # Assuming models are in the current directory
+MAX_RESIDENT_MODELS = int(os.environ.get('MAX_RESIDENT_MODELS', 32))
+# Optional comma-separated list of model filenames to load at startup, or "all"
+WARM_MODELS = os.environ.get('WARM_MODELS', '')
+# Model parameters are packed into one memory-mapped file shared by all worker processes
+# (see model_store.py); with gunicorn --preload it is opened once before the workers fork.
+# The store is built offline after training (python model_store.py); without one, models load from their own files.
+# Set MODEL_STORE=off to load every model from its own file instead.
+MODEL_STORE_PATH = os.environ.get('MODEL_STORE', os.path.join(MODEL_DIR, MODEL_STORE_FILENAME))
 
-print("Loading Prophet models...")
-for filename in os.listdir(MODEL_DIR):
-    if filename.startswith('prophet_model_') and filename.endswith('.pkl'):
-        try:
-            # Extract parameters from filename: e.g., prophet_model_Wheat_Uttar_Pradesh_Varanasi_Varanasi.pkl
-            params_str = filename.replace('prophet_model_', '').replace('.pkl', '')
-            
-            # Split by underscore. This will give parts like ['Wheat', 'Uttar', 'Pradesh', 'Varanasi', 'Varanasi']
-            parts = params_str.split('_')
-            
-            # We know the structure is generally: Commodity_State(can be multi-word)_District_Market
-            # So, the last two parts are District and Market.
-            # The first part is Commodity.
-            # The parts in between form the State.
-
-            if len(parts) >= 4: # Ensure there are enough parts to parse
-                commodity_raw = parts[0]
-                market_raw = parts[-1]
-                district_raw = parts[-2]
-                
-                # Reconstruct the state name by joining the middle parts
-                # This handles states like "Uttar_Pradesh" or "Madhya_Pradesh" correctly
-                # It takes all parts from index 1 up to (but not including) the last two parts.
-                state_parts_raw = parts[1:-2] 
-                state_raw = '_'.join(state_parts_raw)
-
-                # Format for display (replace underscores with spaces and title case)
-                commodity = commodity_raw.replace('_', ' ').title()
-                state = state_raw.replace('_', ' ').title()
-                district = district_raw.replace('_', ' ').title()
-                market = market_raw.replace('_', ' ').title()
-                
-                model_key = (commodity, state, district, market)
-                model = joblib.load(os.path.join(MODEL_DIR, filename))
-                TRAINED_MODELS[model_key] = model
-                print(f"  Loaded model for {model_key}")
-            else:
-                print(f"  Skipping '{filename}': filename format not recognized for parsing parameters.")
+# --- Forecast cache configuration ---
+# Forecasts are computed once for the longest supported horizon and sliced for shorter ones.
+MAX_FORECAST_DAYS = int(os.environ.get('MAX_FORECAST_DAYS', 90)) # index.html allows up to 90 days
+FORECAST_CACHE = ForecastCache(
+    max_entries=int(os.environ.get('FORECAST_CACHE_SIZE', 128)),
+    ttl_seconds=int(os.environ.get('FORECAST_CACHE_TTL', 3600))
+)
 
-        except Exception as e:
-            print(f"  Error loading model '{filename}': {e}")
+# --- Precomputed forecast table ---
+# forecast_table.py writes every model's forecasts for the standard horizons (7, 14 and 30 days)
+# after training; /predict answers from that memory-mapped table when it can and forecasts live
+# for longer horizons, other interval methods and models retrained since the table was built.
+# Set FORECAST_TABLE=off to always forecast live.
+FORECAST_TABLE_PATH = os.environ.get('FORECAST_TABLE', os.path.join(MODEL_DIR, FORECAST_TABLE_FILENAME))
+
+# --- Prediction interval configuration ---
+# Clients choose how yhat_lower/yhat_upper are obtained with ?interval=: 'analytic' (closed form),
+# 'sampled' (simulated, ?interval_samples= paths), 'precomputed' (sampled by Prophet at training
+# time) or 'none' (yhat only). 'auto' uses the precomputed bounds when the model has them and the
+# analytic ones otherwise. The method actually used is reported in the X-Interval-Method header.
+INTERVAL_CHOICES = ('auto',) + INTERVAL_METHODS
+DEFAULT_INTERVAL = os.environ.get('DEFAULT_INTERVAL', 'auto')
+INTERVAL_SAMPLES = int(os.environ.get('INTERVAL_SAMPLES', DEFAULT_INTERVAL_SAMPLES))
+MAX_INTERVAL_SAMPLES = int(os.environ.get('MAX_INTERVAL_SAMPLES', 10000))
+INTERVAL_HEADER = 'X-Interval-Method'
+MODEL_TYPE_HEADER = 'X-Model-Type' # 'prophet', or 'fallback' for markets with little history
+
+# --- Batch prediction configuration ---
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 200)) # Max forecasts per /predict/batch call
+MAX_PREDICT_DAYS = int(os.environ.get('MAX_PREDICT_DAYS', 365)) # Longest horizon /predict and /predict/batch accept
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', min(8, os.cpu_count() or 1)))
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+
+# --- HTTP caching configuration ---
+# Responses carry ETags derived from the model files, so clients and CDNs can revalidate cheaply
+PREDICT_MAX_AGE = int(os.environ.get('PREDICT_MAX_AGE', 300)) # Seconds /predict responses may be reused
+OPTIONS_MAX_AGE = int(os.environ.get('OPTIONS_MAX_AGE', 60)) # Seconds /options responses may be reused
 
-if not TRAINED_MODELS:
-    print("No Prophet models found or loaded. Please ensure models are saved as 'prophet_model_*.pkl'.")
+# --- Price history configuration ---
+# /history serves actual prices from the SQLite store built by history_store.py,
+# and answers 503 until that store exists.
+HISTORY_DB = os.environ.get('HISTORY_DB', os.path.join(MODEL_DIR, HISTORY_DB_FILENAME))
+HISTORY_MAX_AGE = int(os.environ.get('HISTORY_MAX_AGE', 300)) # Seconds /history responses may be reused
+MAX_HISTORY_MARKETS = int(os.environ.get('MAX_HISTORY_MARKETS', 50)) # Max markets per /history call
+
+# --- Metrics ---
+# Exposed at /metrics in the Prometheus text format. Requests sending "X-Profile: 1"
+# get their stage breakdown back in a Server-Timing header.
+PROFILE_HEADER = 'X-Profile'
+METRICS = Metrics()
+METRICS.describe('crop_api_requests_total', 'counter', 'HTTP requests by endpoint and status code.')
+METRICS.describe('crop_api_request_seconds', 'histogram', 'HTTP request latency by endpoint.')
+METRICS.describe('crop_api_stage_seconds', 'histogram', 'Time spent in each serving stage.')
+METRICS.describe('crop_api_model_requests_total', 'counter', 'Forecast requests per model.')
+METRICS.describe('crop_api_model_load_seconds', 'histogram', 'Time to load a model file.')
+METRICS.describe('crop_api_model_reloads_total', 'counter', 'Model files hot-reloaded after they changed on disk.')
+METRICS.describe('crop_api_forecast_table_lookups_total', 'counter', 'Forecasts looked up in the precomputed table, by result.')
+
+def record_model_load(model_key, seconds):
+    METRICS.observe('crop_api_model_load_seconds', seconds)
+
+MODEL_STORE = None if MODEL_STORE_PATH.lower() == 'off' else open_model_store(MODEL_DIR, MODEL_STORE_PATH)
+if MODEL_STORE is not None:
+    print(f"Serving {len(MODEL_STORE)} models from the shared model store {MODEL_STORE_PATH}")
+
+print("Indexing Prophet models...")
+MODEL_REGISTRY = ModelRegistry(MODEL_DIR, max_resident=MAX_RESIDENT_MODELS, on_load=record_model_load,
+                               loader=MODEL_STORE.load if MODEL_STORE is not None else load_model_file)
+for model_key in MODEL_REGISTRY.keys():
+    print(f"  Found model for {model_key}")
+
+if not len(MODEL_REGISTRY):
+    print("No Prophet models found. Please ensure models are saved as 'prophet_model_*.npz' or 'prophet_model_*.pkl'.")
     # For a production app, you might want to exit here: exit() 
+elif WARM_MODELS:
+    print("Warming up Prophet models...")
+    warm_up_started = time.perf_counter()
+    if WARM_MODELS.strip().lower() == 'all':
+        MODEL_REGISTRY.warm_up()
+    else:
+        warm_keys = [parse_model_filename(name.strip()) for name in WARM_MODELS.split(',') if name.strip()]
+        MODEL_REGISTRY.warm_up([key for key in warm_keys if key is not None])
+    print(f"Loaded {MODEL_REGISTRY.loads} models in {time.perf_counter() - warm_up_started:.2f}s")
+
+# --- Hot reload of retrained models ---
+# A background thread per process polls MODEL_DIR and swaps in new, changed and removed
+# model files; requests already holding the old model finish with it. Set to 0 to disable.
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 10))
+MODEL_WATCHER = None
+MODEL_WATCHER_LOCK = threading.Lock()
+
+def invalidate_changed_models(model_keys):
+    """
+    Drops the cached forecasts of models whose file was added, replaced or removed.
+    """
+    removed = sum(FORECAST_CACHE.invalidate(model_key) for model_key in model_keys)
+    METRICS.inc('crop_api_model_reloads_total', amount=len(model_keys))
+    print(f"Model files changed for {sorted(model_keys)}; dropped {removed} cached forecasts")
+
+def ensure_model_watcher():
+    """
+    Starts this process's model watcher if it is not running yet. Called per request rather
+    than at import, since threads started before gunicorn --preload forks do not run in the workers.
+    """
+    global MODEL_WATCHER
+    if MODEL_WATCH_INTERVAL <= 0 or (MODEL_WATCHER is not None and MODEL_WATCHER.pid == os.getpid()):
+        return
+    with MODEL_WATCHER_LOCK:
+        if MODEL_WATCHER is None or MODEL_WATCHER.pid != os.getpid():
+            MODEL_WATCHER = ModelWatcher(MODEL_REGISTRY, MODEL_WATCH_INTERVAL, on_change=invalidate_changed_models).start()
+
+# --- Forecast helpers ---
+def last_history_date(m):
+    """
+    Returns the last date the model was trained on.
+    """
+    if isinstance(m, (ForecastEngine, FallbackForecaster)):
+        return m.last_history_date
+    return m.history['ds'].iloc[-1]
+
+def resolve_interval(m, interval, days):
+    """
+    Returns the interval method used to forecast `days` days with model m when `interval`
+    (one of INTERVAL_CHOICES) is requested. Precomputed bounds fall back to the analytic ones
+    past the horizon they were stored for; models served by Prophet.predict only support
+    Prophet's own sampling, or no interval, and fallback forecasters the analytic one.
+    """
+    if interval == 'none':
+        return 'none'
+    if isinstance(m, FallbackForecaster):
+        return 'analytic'
+    if not isinstance(m, ForecastEngine):
+        return 'sampled'
+    if interval in ('auto', 'precomputed'):
+        return 'precomputed' if m.precomputed_days() >= days else 'analytic'
+    return interval
+
+def compute_forecast(m, days, interval='analytic', samples=None):
+    """
+    Forecasts the next `days` days and returns only the future rows.
+    `interval` is a resolved method (see resolve_interval); `samples` is the number of
+    simulated paths for 'sampled', None for the default.
+    """
+    if isinstance(m, (ForecastEngine, FallbackForecaster)):
+        with timed_stage(METRICS, 'engine_predict'):
+            return m.predict(days, interval, samples or INTERVAL_SAMPLES)
+
+    if interval == 'none' or samples is not None:
+        m = copy.copy(m) # Shallow copy, so concurrent requests never see each other's setting
+        m.uncertainty_samples = 0 if interval == 'none' else samples
+    with timed_stage(METRICS, 'make_future_dataframe'):
+        future = m.make_future_dataframe(periods=days)
+    with timed_stage(METRICS, 'prophet_predict'):
+        forecast = m.predict(future)
+
+    last_historical_date = m.history['ds'].max()
+    future_forecast = forecast[forecast['ds'] > last_historical_date]
+    columns = [column for column in ('ds', 'yhat', 'yhat_lower', 'yhat_upper') if column in future_forecast]
+    return future_forecast[columns].reset_index(drop=True)
+
+# The table is reopened whenever forecast_table.py replaces it
+FORECAST_TABLE = (None, None) # (index file fingerprint, ForecastTable)
+FORECAST_TABLE_LOCK = threading.Lock()
+
+def get_forecast_table():
+    """
+    Returns the ForecastTable at FORECAST_TABLE_PATH, or None if it is disabled, missing or unreadable.
+    """
+    global FORECAST_TABLE
+    if FORECAST_TABLE_PATH.lower() == 'off':
+        return None
+    try:
+        current = model_fingerprint(FORECAST_TABLE_PATH)
+    except OSError:
+        return None
+    fingerprint, table = FORECAST_TABLE
+    if fingerprint != current:
+        with FORECAST_TABLE_LOCK:
+            fingerprint, table = FORECAST_TABLE
+            if fingerprint != current:
+                try:
+                    table = ForecastTable(FORECAST_TABLE_PATH)
+                    print(f"Serving precomputed forecasts of {len(table)} models from {FORECAST_TABLE_PATH}")
+                except (OSError, ValueError) as e:
+                    print(f"Forecast table unavailable, forecasting live: {e}")
+                    table = None
+                FORECAST_TABLE = (current, table)
+    return table
+
+def table_forecast(model_key, days, interval=DEFAULT_INTERVAL, samples=None):
+    """
+    Returns (future forecast, info) for model_key from the precomputed table, or None when
+    the request has to be forecast live (see ForecastTable.lookup).
+    """
+    table = get_forecast_table()
+    if table is None or samples is not None:
+        return None
+    with timed_stage(METRICS, 'forecast_table'):
+        result = table.lookup(model_key, days, interval, MODEL_REGISTRY.fingerprint(model_key))
+    METRICS.inc('crop_api_forecast_table_lookups_total', (('result', 'miss' if result is None else 'hit'),))
+    return result
+
+def get_forecast(model_key, days, interval=DEFAULT_INTERVAL, samples=None):
+    """
+    Returns (future forecast, info) for model_key over the next `days` days, info being
+    {"model_type": ..., "interval_method": ...} as reported to clients.
+    The standard horizons are read from the precomputed forecast table when it is current.
+    Otherwise horizons up to MAX_FORECAST_DAYS are served by slicing one cached forecast;
+    longer horizons are computed directly and not cached.
+    """
+    ensure_model_watcher()
+    precomputed = table_forecast(model_key, days, interval, samples)
+    if precomputed is not None:
+        return precomputed
+    with timed_stage(METRICS, 'model_lookup'):
+        m, fingerprint = MODEL_REGISTRY.get_entry(model_key)
+    horizon = max(days, MAX_FORECAST_DAYS)
+    method = resolve_interval(m, interval, horizon)
+    samples = samples if method == 'sampled' else None
+    info = {"model_type": getattr(m, 'model_type', 'prophet'), "interval_method": method}
+    if days > MAX_FORECAST_DAYS:
+        return compute_forecast(m, days, method, samples), info
+
+    cache_key = (model_key, fingerprint, last_history_date(m), method, samples)
+    with timed_stage(METRICS, 'forecast_cache'): # Includes the forecast itself on a miss
+        forecast = FORECAST_CACHE.get_or_compute(cache_key, lambda: compute_forecast(m, horizon, method, samples))
+    return forecast.head(days), info
+
+def forecast_headers(info):
+    """
+    Response headers reporting a forecast's info (see get_forecast), for formats without room for it.
+    """
+    return {MODEL_TYPE_HEADER: info["model_type"], INTERVAL_HEADER: info["interval_method"]}
+
+# /predict response formats: a list of one dict per day, or one list per field
+RESPONSE_FORMATS = ('records', 'columnar')
+
+def forecast_to_columns(future_forecast):
+    """
+    Converts a future forecast DataFrame into the columnar /predict response,
+    {"date": [...], "predicted_price": [...], "lower_bound": [...], "upper_bound": [...]}.
+    Dates are formatted and prices rounded to 2 decimals on whole arrays at once.
+    """
+    # Column by column: selecting the three price columns as one block copies the frame
+    dates = np.datetime_as_string(future_forecast['ds'].to_numpy().astype('datetime64[D]'))
+    columns = {
+        "date": dates.tolist(),
+        "predicted_price": future_forecast['yhat'].to_numpy(dtype=float).round(2).tolist(),
+    }
+    if 'yhat_lower' in future_forecast: # Left out of forecasts made with interval=none
+        columns["lower_bound"] = future_forecast['yhat_lower'].to_numpy(dtype=float).round(2).tolist()
+        columns["upper_bound"] = future_forecast['yhat_upper'].to_numpy(dtype=float).round(2).tolist()
+    return columns
+
+def forecast_to_records(future_forecast):
+    """
+    Converts a future forecast DataFrame into the list of dicts returned by /predict.
+    """
+    columns = forecast_to_columns(future_forecast)
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+def serialize_forecast(future_forecast, format='records', info=None):
+    """
+    Serializes a forecast in one of RESPONSE_FORMATS. Columnar responses also carry the
+    forecast's info (model type and interval method), which records responses can only
+    carry in headers.
+    """
+    with timed_stage(METRICS, 'serialize'):
+        if format == 'columnar':
+            columns = forecast_to_columns(future_forecast)
+            if info is not None:
+                columns.update(info)
+            return columns
+        return forecast_to_records(future_forecast)
+
+def forecast_horizons(model_key, horizons, format='records', interval=DEFAULT_INTERVAL, samples=None):
+    """
+    Forecasts model_key once for the longest of `horizons` and slices it for the others.
+    Returns a dict mapping each horizon to its serialized predictions, and the forecast's info.
+    """
+    longest, info = get_forecast(model_key, max(horizons), interval, samples)
+    return {days: serialize_forecast(longest.head(days), format, info) for days in set(horizons)}, info
+
+# --- Conditional GET helpers ---
+def make_etag(*parts):
+    """
+    Returns a strong ETag (quoted) for a response fully determined by `parts`.
+    """
+    return '"' + hashlib.sha256(repr(parts).encode()).hexdigest()[:32] + '"'
+
+def predict_etag(query):
+    """
+    ETag of a /predict response: the forecast only changes when the model file is replaced.
+    The interval options are part of the query, so each interval method has its own ETag.
+    """
+    return make_etag('predict', MODEL_REGISTRY.fingerprint(query.model_key), tuple(query))
+
+def options_etag(view, filters):
+    """
+    ETag of an /options response: it only changes when model files are added, removed or replaced.
+    """
+    return make_etag('options', MODEL_REGISTRY.index_fingerprint(), view, filters)
+
+def etag_matches(if_none_match, etag):
+    """
+    Returns True if an If-None-Match header value ("*" or a list of ETags) matches etag.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # If-None-Match uses the weak comparison, so W/"..." matches too
+    candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return etag in candidates
+
+def cache_headers(etag, max_age):
+    return {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+
+# --- Request validation shared by the Flask app and the ASGI app (asgi_app.py) ---
+MODEL_KEY_FIELDS = ('commodity', 'state', 'district', 'market')
+PredictQuery = namedtuple('PredictQuery', ['model_key', 'days', 'format', 'interval', 'samples'])
+
+def validate_interval_args(args):
+    """
+    Validates the 'interval' and 'interval_samples' parameters of /predict or a /predict/batch body.
+    Returns ((interval, samples), None), samples being None unless interval is 'sampled',
+    or (None, (error_payload, status)) for a bad request.
+    """
+    interval = args.get('interval') or DEFAULT_INTERVAL
+    if interval not in INTERVAL_CHOICES:
+        return None, ({"error": f"Invalid 'interval' parameter. Must be one of {', '.join(INTERVAL_CHOICES)}."}, 400)
+    if interval != 'sampled':
+        return (interval, None), None
+    try:
+        samples = int(args.get('interval_samples', INTERVAL_SAMPLES))
+    except (TypeError, ValueError):
+        return None, ({"error": "Invalid 'interval_samples' parameter. Must be an integer."}, 400)
+    if not 1 <= samples <= MAX_INTERVAL_SAMPLES:
+        return None, ({"error": f"'interval_samples' must be between 1 and {MAX_INTERVAL_SAMPLES}."}, 400)
+    return (interval, samples), None
+
+def validate_predict_args(args):
+    """
+    Validates the /predict query parameters.
+    Returns (PredictQuery, None), or (None, (error_payload, status)) for a bad request.
+    """
+    days_str = args.get('days', '7')
+    model_key = tuple(args.get(field) for field in MODEL_KEY_FIELDS)
+    if not all(model_key):
+        return None, ({"error": "Missing commodity, state, district, or market parameter."}, 400)
+    if model_key not in MODEL_REGISTRY:
+        return None, ({"error": f"No model found for {model_key}. Please train a model for this combination."}, 404)
+    try:
+        days = int(days_str)
+    except ValueError:
+        return None, ({"error": "Invalid 'days' parameter. Must be an integer."}, 400)
+    if days <= 0:
+        return None, ({"error": "Number of days must be a positive integer."}, 400)
+    if days > MAX_PREDICT_DAYS:
+        return None, ({"error": f"Number of days must be at most {MAX_PREDICT_DAYS}."}, 400)
+    format = args.get('format', 'records')
+    if format not in RESPONSE_FORMATS:
+        return None, ({"error": "Invalid 'format' parameter. Must be 'records' or 'columnar'."}, 400)
+    interval_options, error = validate_interval_args(args)
+    if error:
+        return None, error
+    return PredictQuery(model_key, days, format, *interval_options), None
+
+def validate_batch_payload(payload):
+    """
+    Validates a /predict/batch body.
+    Returns (results, groups, (interval, samples), None), where results holds one dict per
+    request (already filled in for invalid entries), groups maps each model_key to its
+    [(index, days), ...] and the interval options apply to the whole batch,
+    or (None, None, None, (error_payload, status)) if the body itself is invalid.
+    """
+    items = payload.get('requests') if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        return None, None, None, ({"error": "Expected a JSON body with a 'requests' list."}, 400)
+    if len(items) > MAX_BATCH_SIZE:
+        return None, None, None, ({"error": f"Too many requests in batch: {len(items)} (max {MAX_BATCH_SIZE})."}, 400)
+    interval_options, error = validate_interval_args(payload if isinstance(payload, dict) else {})
+    if error:
+        return None, None, None, error
+
+    results = [None] * len(items)
+    groups = {} # model_key -> [(index, days), ...] so each model is forecast once
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = {"error": "Each request must be a JSON object.", "status": 400}
+            continue
+
+        model_key = tuple(item.get(field) for field in MODEL_KEY_FIELDS)
+        result = dict(zip(MODEL_KEY_FIELDS, model_key))
+        results[index] = result
+        if not all(model_key):
+            result.update({"error": "Missing commodity, state, district, or market parameter.", "status": 400})
+            continue
+        if not all(isinstance(part, str) for part in model_key):
+            result.update({"error": "Commodity, state, district and market must be strings.", "status": 400})
+            continue
+        try:
+            days = int(item.get('days', 7))
+        except (TypeError, ValueError):
+            result.update({"error": "Invalid 'days' parameter. Must be an integer.", "status": 400})
+            continue
+        result["days"] = days
+        if days <= 0:
+            result.update({"error": "Number of days must be a positive integer.", "status": 400})
+        elif days > MAX_PREDICT_DAYS:
+            result.update({"error": f"Number of days must be at most {MAX_PREDICT_DAYS}.", "status": 400})
+        elif model_key not in MODEL_REGISTRY:
+            result.update({"error": f"No model found for {model_key}. Please train a model for this combination.", "status": 404})
+        else:
+            groups.setdefault(model_key, []).append((index, days))
+    return results, groups, interval_options, None
+
+def fill_batch_results(results, entries, outcome=None, error=None):
+    """
+    Fans one model's forecast_horizons outcome (or the error raised computing it) back out to its batch entries.
+    """
+    for index, days in entries:
+        if error is not None:
+            results[index].update({"error": f"An internal server error occurred: {error}", "status": 500})
+        else:
+            predictions_by_days, info = outcome
+            results[index].update({"predictions": predictions_by_days[days], **info})
+
+def validate_options_args(args):
+    """
+    Validates the /options query parameters: an optional view ('flat' or 'tree') and
+    optional commodity, state, district and market filters for the flat view.
+    Returns (view, filters, None), or (None, None, (error_payload, status)) for a bad request.
+    """
+    view = args.get('view', 'flat')
+    if view not in ('flat', 'tree'):
+        return None, None, ({"error": "Invalid 'view' parameter. Must be 'flat' or 'tree'."}, 400)
+    filters = tuple(args.get(field) or None for field in OPTION_FIELDS)
+    return view, filters, None
+
+# The options index is rebuilt only when the registry's set of model files changes
+OPTIONS_INDEX = (None, OptionsIndex([])) # (registry index fingerprint, index)
+OPTIONS_INDEX_LOCK = threading.Lock()
+
+def get_options_index():
+    """
+    Returns the OptionsIndex for the current registry contents.
+    """
+    global OPTIONS_INDEX
+    fingerprint, index = OPTIONS_INDEX
+    if fingerprint != MODEL_REGISTRY.index_fingerprint():
+        with OPTIONS_INDEX_LOCK:
+            fingerprint, index = OPTIONS_INDEX
+            current = MODEL_REGISTRY.index_fingerprint()
+            if fingerprint != current:
+                index = OptionsIndex(MODEL_REGISTRY.keys())
+                OPTIONS_INDEX = (current, index)
+    return index
+
+def options_payload(view='flat', filters=(None, None, None, None)):
+    """
+    Returns the /options response body from the precomputed index (no model needs to be loaded):
+    the flat option lists of the models matching `filters`, or the full
+    {"hierarchy": {commodity: {state: {district: [markets]}}}} for the tree view.
+    """
+    index = get_options_index()
+    if view == 'tree':
+        return {"hierarchy": index.hierarchy}
+    return index.options(*filters)
+
+# --- Price history helpers ---
+HistoryQuery = namedtuple('HistoryQuery', ['filters', 'start', 'end', 'freq'])
+HISTORY_STORE = None
+HISTORY_STORE_LOCK = threading.Lock()
+
+def get_history_store():
+    """
+    Returns the HistoryStore of HISTORY_DB, opening it once the file exists, or None before that.
+    """
+    global HISTORY_STORE
+    if HISTORY_STORE is None and os.path.exists(HISTORY_DB):
+        with HISTORY_STORE_LOCK:
+            if HISTORY_STORE is None:
+                HISTORY_STORE = HistoryStore(HISTORY_DB)
+    return HISTORY_STORE
+
+def validate_history_args(args):
+    """
+    Validates the /history query parameters: commodity, state, district and market filters,
+    each of which may be repeated to select several values, optional 'start' and 'end'
+    dates (YYYY-MM-DD) and a 'freq' of daily, weekly or monthly.
+    Returns (HistoryQuery, None), or (None, (error_payload, status)) for a bad request.
+    """
+    filters = tuple(tuple(sorted(set(args.getlist(field)))) or None for field in HISTORY_KEY_COLUMNS)
+    if not any(filters):
+        return None, ({"error": "Pass at least one of commodity, state, district or market."}, 400)
+    dates = {}
+    for name in ('start', 'end'):
+        value = args.get(name)
+        if value:
+            try:
+                value = datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
+                return None, ({"error": f"Invalid '{name}' parameter. Must be a date in YYYY-MM-DD format."}, 400)
+        dates[name] = value or None
+    freq = args.get('freq', 'daily')
+    if freq not in HISTORY_FREQUENCIES:
+        return None, ({"error": f"Invalid 'freq' parameter. Must be one of {', '.join(HISTORY_FREQUENCIES)}."}, 400)
+    return HistoryQuery(filters, dates['start'], dates['end'], freq), None
+
+def history_etag(store, query):
+    """
+    ETag of a /history response: it only changes when the history store is updated.
+    """
+    return make_etag('history', store.fingerprint(), tuple(query))
+
+def history_payload(store, query):
+    """
+    Returns (the /history response body, None) with one series per market matching the query,
+    or (None, (error_payload, status)) when it matches more than MAX_HISTORY_MARKETS markets.
+    """
+    with timed_stage(METRICS, 'history_query'):
+        keys = store.matching_keys(query.filters)
+        if len(keys) > MAX_HISTORY_MARKETS:
+            return None, ({"error": f"{len(keys)} markets match (max {MAX_HISTORY_MARKETS}). Narrow the filters."}, 400)
+        series = [
+            {**dict(zip(HISTORY_KEY_COLUMNS, key)), **store.series(key, query.start, query.end, query.freq)}
+            for key in keys
+        ]
+    return {"freq": query.freq, "start": query.start, "end": query.end, "series": series}, None
+
+# --- Metrics helpers shared by the Flask app and the ASGI app ---
+def count_model_request(model_key, amount=1):
+    METRICS.inc('crop_api_model_requests_total', tuple(zip(MODEL_KEY_FIELDS, model_key)), amount)
+
+def record_request(endpoint, status, seconds):
+    METRICS.inc('crop_api_requests_total', (('endpoint', endpoint), ('status', str(status))))
+    METRICS.observe('crop_api_request_seconds', seconds, (('endpoint', endpoint),))
+
+def metrics_text(extra_gauges=(), local_forecasts=True):
+    """
+    Returns the /metrics body: request and stage metrics plus, when forecasts run in this
+    process (local_forecasts), the current forecast cache and model registry stats.
+    """
+    gauges = [('crop_api_models_indexed', 'gauge', 'Model files found in MODEL_DIR.', [((), len(MODEL_REGISTRY))])]
+    if local_forecasts:
+        cache = FORECAST_CACHE.stats()
+        gauges += [
+            ('crop_api_forecast_cache_hits_total', 'counter', 'Forecast cache hits.', [((), cache['hits'])]),
+            ('crop_api_forecast_cache_misses_total', 'counter', 'Forecast cache misses.', [((), cache['misses'])]),
+            ('crop_api_forecast_cache_evictions_total', 'counter', 'Forecasts evicted from the cache.', [((), cache['evictions'])]),
+            ('crop_api_forecast_cache_entries', 'gauge', 'Forecasts currently cached.', [((), cache['entries'])]),
+            ('crop_api_models_resident', 'gauge', 'Models currently loaded in memory.', [((), MODEL_REGISTRY.resident_count())]),
+            ('crop_api_model_loads_total', 'counter', 'Model files loaded from disk.', [((), MODEL_REGISTRY.loads)]),
+            ('crop_api_model_evictions_total', 'counter', 'Models evicted from memory.', [((), MODEL_REGISTRY.evictions)]),
+        ]
+    return METRICS.render(gauges + list(extra_gauges))
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    ensure_model_watcher()
+    start_profile(request.headers.get(PROFILE_HEADER) == '1')
+
+@app.after_request
+def finish_request_metrics(response):
+    """
+    Records the request in the metrics and, for profiled requests, adds the Server-Timing header.
+    """
+    seconds = time.perf_counter() - g.request_started
+    record_request(request.url_rule.rule if request.url_rule else 'unmatched', response.status_code, seconds)
+    stages = profile_stages()
+    if stages is not None:
+        response.headers['Server-Timing'] = server_timing(stages + [('total', seconds)])
+    return response
 
 # --- NEW: Root route to serve index.html ---
 @app.route('/', methods=['GET'])
@@ -74,69 +650,114 @@ def predict():
     """
     API endpoint to get future crop price predictions.
     Expects 'days', 'commodity', 'state', 'district', 'market' as query parameters.
+    With format=columnar the response is one list per field instead of one dict per day.
+    Optional 'interval' and 'interval_samples' choose how the bounds are computed (see INTERVAL_CHOICES).
     """
-    try:
-        days_str = request.args.get('days', '7')
-        commodity_param = request.args.get('commodity')
-        state_param = request.args.get('state')
-        district_param = request.args.get('district')
-        market_param = request.args.get('market')
-
-        if not all([commodity_param, state_param, district_param, market_param]):
-            return jsonify({"error": "Missing commodity, state, district, or market parameter."}), 400
-
-        model_key = (commodity_param, state_param, district_param, market_param)
-        
-        if model_key not in TRAINED_MODELS:
-            return jsonify({"error": f"No model found for {model_key}. Please train a model for this combination."}), 404
+    with timed_stage(METRICS, 'validate'):
+        query, error = validate_predict_args(request.args)
+    if error:
+        return jsonify(error[0]), error[1]
+    count_model_request(query.model_key)
 
-        m = TRAINED_MODELS[model_key] # Select the correct model
-
-        days = int(days_str)
-        if days <= 0:
-            return jsonify({"error": "Number of days must be a positive integer."}), 400
-
-        future = m.make_future_dataframe(periods=days)
-        forecast = m.predict(future)
+    headers = cache_headers(predict_etag(query), PREDICT_MAX_AGE)
+    if etag_matches(request.headers.get('If-None-Match'), headers["ETag"]):
+        return '', 304, headers # The client's copy is current; skip the forecast entirely
+    try:
+        future_forecast, info = get_forecast(query.model_key, query.days, query.interval, query.samples)
+        predictions = serialize_forecast(future_forecast, query.format, info)
+        with timed_stage(METRICS, 'encode'):
+            response = jsonify(predictions)
+        return response, 200, {**headers, **forecast_headers(info)}
+    except Exception as e:
+        return jsonify({"error": f"An internal server error occurred: {e}"}), 500
 
-        last_historical_date = m.history['ds'].max()
-        future_forecast = forecast[forecast['ds'] > last_historical_date]
+# --- API Endpoint for Batch Predictions ---
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    API endpoint to get predictions for many markets and horizons in one call.
+    Expects a JSON body {"requests": [{"commodity", "state", "district", "market", "days"}, ...]}
+    (a bare list is accepted too) and returns {"results": [...]} in the same order.
+    The body may also set "interval" and "interval_samples" for the whole batch; each
+    result reports its "model_type" and "interval_method".
+    Each result either holds "predictions" or an "error" with its HTTP-like "status",
+    so one bad entry does not fail the whole batch.
+    """
+    results, groups, interval_options, error = validate_batch_payload(request.get_json(silent=True))
+    if error:
+        return jsonify(error[0]), error[1]
 
-        predictions = []
-        for index, row in future_forecast.iterrows():
-            predictions.append({
-                "date": row['ds'].strftime('%Y-%m-%d'),
-                "predicted_price": round(row['yhat'], 2),
-                "lower_bound": round(row['yhat_lower'], 2),
-                "upper_bound": round(row['yhat_upper'], 2)
-            })
+    for model_key, entries in groups.items():
+        count_model_request(model_key, len(entries))
 
-        return jsonify(predictions)
+    # Forecast each model on the worker pool, then fan the horizons back out.
+    # Each task runs in a copy of this request's context so its stages land in the same profile.
+    futures = {
+        model_key: BATCH_EXECUTOR.submit(
+            contextvars.copy_context().run, forecast_horizons, model_key, [days for _, days in entries], 'records', *interval_options
+        )
+        for model_key, entries in groups.items()
+    }
+    for model_key, future in futures.items():
+        try:
+            fill_batch_results(results, groups[model_key], future.result())
+        except Exception as e:
+            fill_batch_results(results, groups[model_key], error=e)
 
-    except ValueError:
-        return jsonify({"error": "Invalid 'days' parameter. Must be an integer."}), 400
-    except Exception as e:
-        return jsonify({"error": f"An internal server error occurred: {e}"}), 500
+    with timed_stage(METRICS, 'encode'):
+        return jsonify({"results": results})
 
 # --- API Endpoint for getting available options ---
 @app.route('/options', methods=['GET'])
 def get_options():
     """
     API endpoint to return available commodity, state, district, market options
-    based on the loaded models.
+    based on the indexed model files (no model needs to be loaded).
+    Optional 'commodity', 'state', 'district' and 'market' parameters narrow the lists
+    to the models matching them (e.g. /options?state=Uttar Pradesh), and
+    /options?view=tree returns the commodity -> state -> district -> market hierarchy.
     """
     print("Frontend requested /options endpoint.") # Debugging print
-    commodities = sorted(list(set(k[0] for k in TRAINED_MODELS.keys())))
-    states = sorted(list(set(k[1] for k in TRAINED_MODELS.keys())))
-    districts = sorted(list(set(k[2] for k in TRAINED_MODELS.keys())))
-    markets = sorted(list(set(k[3] for k in TRAINED_MODELS.keys())))
-
-    return jsonify({
-        "commodities": commodities,
-        "states": states,
-        "districts": districts,
-        "markets": markets
-    })
+    view, filters, error = validate_options_args(request.args)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    headers = cache_headers(options_etag(view, filters), OPTIONS_MAX_AGE)
+    if etag_matches(request.headers.get('If-None-Match'), headers["ETag"]):
+        return '', 304, headers
+    return jsonify(options_payload(view, filters)), 200, headers
+
+# --- API Endpoint for historical prices ---
+@app.route('/history', methods=['GET'])
+def get_history():
+    """
+    API endpoint to return actual prices from the history store, for one or many markets,
+    e.g. /history?commodity=Wheat&state=Uttar Pradesh&start=2025-01-01&freq=weekly.
+    Each series holds date, min_price, max_price and modal_price lists (plus the number of
+    trading days per bucket for weekly and monthly series).
+    """
+    query, error = validate_history_args(request.args)
+    if error:
+        return jsonify(error[0]), error[1]
+    store = get_history_store()
+    if store is None:
+        return jsonify({"error": "No price history is available on this server."}), 503
+
+    headers = cache_headers(history_etag(store, query), HISTORY_MAX_AGE)
+    if etag_matches(request.headers.get('If-None-Match'), headers["ETag"]):
+        return '', 304, headers
+    payload, error = history_payload(store, query)
+    if error:
+        return jsonify(error[0]), error[1]
+    return jsonify(payload), 200, headers
+
+# --- Prometheus metrics ---
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Exposes request, stage, per-model, cache and registry metrics in the Prometheus text format.
+    """
+    return Response(metrics_text(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 
 # --- Run the Flask App ---
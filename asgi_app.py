@@ -0,0 +1,298 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Route
+
+from app import app as flask_app
+from app import (
+    DEFAULT_INTERVAL, HISTORY_MAX_AGE, METRICS, OPTIONS_MAX_AGE, PREDICT_MAX_AGE, PROFILE_HEADER, cache_headers,
+    count_model_request, ensure_model_watcher, etag_matches, fill_batch_results, forecast_headers, forecast_horizons,
+    get_history_store, history_etag, history_payload, metrics_text, options_etag, options_payload, predict_etag,
+    record_request, serialize_forecast, table_forecast, validate_batch_payload, validate_history_args,
+    validate_options_args, validate_predict_args,
+)
+from serving_metrics import PROMETHEUS_CONTENT_TYPE, profile_stages, server_timing, start_profile, timed_stage
+
+# --- ASGI serving mode ---
+# Same routes and JSON responses as app.py, but forecasts run on a bounded process pool
+# so a slow Prophet.predict never blocks / or /options.
+# Run with: uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+FORECAST_WORKERS = int(os.environ.get('FORECAST_WORKERS', os.cpu_count() or 1))
+# Distinct forecasts queued or running at once; further requests get a 503 instead of waiting
+MAX_PENDING_FORECASTS = int(os.environ.get('MAX_PENDING_FORECASTS', 64))
+
+
+class FlaskJSONResponse(JSONResponse):
+    """
+    JSON response encoded by the Flask app's JSON provider with the compact separators
+    jsonify passes it, so both apps send identical bytes under the same strong ETag.
+    """
+
+    def render(self, content):
+        return (flask_app.json.dumps(content, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class PoolBusy(Exception):
+    """
+    Raised when MAX_PENDING_FORECASTS forecasts are already queued or running.
+    """
+
+
+class ForecastPool:
+    """
+    Runs forecast_horizons on a process pool. Concurrent calls with the same arguments
+    share one computation, and new work is refused once max_pending computations are in flight.
+    Only used from the event loop thread, so the in-flight table needs no lock.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = None
+        self._inflight = {}
+        self.coalesced = 0
+        self.rejected = 0
+
+    def start(self):
+        # Workers are spawned rather than forked so they never inherit locks held by server threads;
+        # each one imports app.py and keeps its own model registry and forecast cache
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def pending(self):
+        return len(self._inflight)
+
+    async def forecast_horizons(self, model_key, horizons, format='records', interval=DEFAULT_INTERVAL, samples=None):
+        """
+        Returns forecast_horizons(model_key, horizons, format, interval, samples) computed in a worker process.
+        """
+        args = (model_key, tuple(sorted(set(horizons))), format, interval, samples)
+        future = self._inflight.get(args)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            if len(self._inflight) >= self.max_pending:
+                self.rejected += 1
+                raise PoolBusy()
+            future = asyncio.get_running_loop().run_in_executor(self.executor, forecast_horizons, *args)
+            self._inflight[args] = future
+            future.add_done_callback(lambda _: self._inflight.pop(args, None))
+        # Shielded so a client disconnecting does not cancel the computation other requests share
+        return await asyncio.shield(future)
+
+
+FORECAST_POOL = ForecastPool(FORECAST_WORKERS, MAX_PENDING_FORECASTS)
+
+
+def busy_response():
+    return FlaskJSONResponse(
+        {"error": "Server is busy with too many forecasts. Please retry shortly."},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware doing what app.py's before/after request hooks do: records every request
+    in METRICS and adds the Server-Timing header to requests sending "X-Profile: 1".
+    Stages timed in the worker processes (model lookup, predict, serialize) are not included;
+    here the forecast shows up as the single "pool_forecast" stage.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        profile_header = PROFILE_HEADER.lower().encode()
+        start_profile(any(name == profile_header and value == b'1' for name, value in scope['headers']))
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                stages = profile_stages()
+                if stages is not None:
+                    timing = server_timing(stages + [('total', time.perf_counter() - started)])
+                    message = {**message, 'headers': list(message.get('headers', [])) + [(b'server-timing', timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            endpoint = scope['path'] if scope['path'] in ROUTE_PATHS else 'unmatched'
+            record_request(endpoint, status, time.perf_counter() - started)
+
+
+# --- Routes ---
+async def serve_index(request):
+    """
+    Serves the index.html file as the main page of the application.
+    """
+    return FileResponse('index.html')
+
+
+async def predict(request):
+    """
+    Async version of app.predict: validation and precomputed-table lookups run inline,
+    live forecasts run on the process pool.
+    """
+    with timed_stage(METRICS, 'validate'):
+        query, error = validate_predict_args(request.query_params)
+    if error:
+        return FlaskJSONResponse(error[0], status_code=error[1])
+    count_model_request(query.model_key)
+
+    headers = cache_headers(predict_etag(query), PREDICT_MAX_AGE)
+    if etag_matches(request.headers.get('if-none-match'), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    precomputed = table_forecast(query.model_key, query.days, query.interval, query.samples)
+    if precomputed is not None: # A slice of a mapped file; not worth a trip to the pool
+        future_forecast, info = precomputed
+        predictions = serialize_forecast(future_forecast, query.format, info)
+        with timed_stage(METRICS, 'encode'):
+            return FlaskJSONResponse(predictions, headers={**headers, **forecast_headers(info)})
+    try:
+        with timed_stage(METRICS, 'pool_forecast'):
+            predictions_by_days, info = await FORECAST_POOL.forecast_horizons(
+                query.model_key, [query.days], query.format, query.interval, query.samples
+            )
+    except PoolBusy:
+        return busy_response()
+    except Exception as e:
+        return FlaskJSONResponse({"error": f"An internal server error occurred: {e}"}, status_code=500)
+    with timed_stage(METRICS, 'encode'):
+        return FlaskJSONResponse(predictions_by_days[query.days], headers={**headers, **forecast_headers(info)})
+
+
+async def predict_batch(request):
+    """
+    Async version of app.predict_batch: each model in the batch is forecast once on the process pool.
+    The whole batch is refused with a 503 if the pool cannot take all of its models.
+    """
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = None
+    results, groups, interval_options, error = validate_batch_payload(payload)
+    if error:
+        return FlaskJSONResponse(error[0], status_code=error[1])
+    if FORECAST_POOL.pending() + len(groups) > FORECAST_POOL.max_pending:
+        FORECAST_POOL.rejected += 1
+        return busy_response()
+
+    model_keys = list(groups)
+    for model_key in model_keys:
+        count_model_request(model_key, len(groups[model_key]))
+    with timed_stage(METRICS, 'pool_forecast'):
+        outcomes = await asyncio.gather(
+            *[
+                FORECAST_POOL.forecast_horizons(model_key, [days for _, days in groups[model_key]], 'records', *interval_options)
+                for model_key in model_keys
+            ],
+            return_exceptions=True,
+        )
+    for model_key, outcome in zip(model_keys, outcomes):
+        if isinstance(outcome, Exception):
+            fill_batch_results(results, groups[model_key], error=outcome)
+        else:
+            fill_batch_results(results, groups[model_key], outcome)
+    with timed_stage(METRICS, 'encode'):
+        return FlaskJSONResponse({"results": results})
+
+
+async def get_options(request):
+    """
+    Returns the available commodity, state, district and market options, as app.get_options does.
+    """
+    view, filters, error = validate_options_args(request.query_params)
+    if error:
+        return FlaskJSONResponse(error[0], status_code=error[1])
+
+    headers = cache_headers(options_etag(view, filters), OPTIONS_MAX_AGE)
+    if etag_matches(request.headers.get('if-none-match'), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return FlaskJSONResponse(options_payload(view, filters), headers=headers)
+
+
+async def get_history(request):
+    """
+    Returns actual prices from the history store, as app.get_history does. SQLite queries
+    are short index range scans, so they run in Starlette's thread pool rather than the process pool.
+    """
+    query, error = validate_history_args(request.query_params)
+    if error:
+        return FlaskJSONResponse(error[0], status_code=error[1])
+    store = get_history_store()
+    if store is None:
+        return FlaskJSONResponse({"error": "No price history is available on this server."}, status_code=503)
+
+    headers = cache_headers(history_etag(store, query), HISTORY_MAX_AGE)
+    if etag_matches(request.headers.get('if-none-match'), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    payload, error = await run_in_threadpool(history_payload, store, query)
+    if error:
+        return FlaskJSONResponse(error[0], status_code=error[1])
+    return FlaskJSONResponse(payload, headers=headers)
+
+
+async def get_metrics(request):
+    """
+    Prometheus metrics of this process plus the forecast pool's queue stats. The forecast cache
+    and model loads live in the worker processes and are not reported here.
+    """
+    pool_gauges = [
+        ('crop_api_pool_pending', 'gauge', 'Forecasts queued or running on the process pool.', [((), FORECAST_POOL.pending())]),
+        ('crop_api_pool_coalesced_total', 'counter', 'Requests that shared an in-flight forecast.', [((), FORECAST_POOL.coalesced)]),
+        ('crop_api_pool_rejected_total', 'counter', 'Requests refused with a 503.', [((), FORECAST_POOL.rejected)]),
+    ]
+    return Response(metrics_text(pool_gauges, local_forecasts=False), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    FORECAST_POOL.start()
+    ensure_model_watcher() # Keeps /options and ETags current here; each worker process runs its own watcher
+    print(f"Forecasting on {FORECAST_POOL.workers} worker processes (max {FORECAST_POOL.max_pending} pending).")
+    try:
+        yield
+    finally:
+        FORECAST_POOL.shutdown()
+
+
+ROUTES = [
+    Route('/', serve_index, methods=['GET']),
+    Route('/predict', predict, methods=['GET']),
+    Route('/predict/batch', predict_batch, methods=['POST']),
+    Route('/options', get_options, methods=['GET']),
+    Route('/history', get_history, methods=['GET']),
+    Route('/metrics', get_metrics, methods=['GET']),
+]
+ROUTE_PATHS = {route.path for route in ROUTES}
+
+app = Starlette(
+    routes=ROUTES,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*']), # Same as CORS(app) in app.py
+        Middleware(MetricsMiddleware),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,235 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+
+from price_aggregation import AGGREGATORS, FILL_METHODS, SERIES_CACHE_DIR
+from train_models import (
+    DEFAULT_AGGREGATE, GROUP_COLUMNS, MANIFEST_FILENAME, MIN_ROWS, PROPHET_KWARGS, load_daily_series, load_manifest,
+    model_basename, save_manifest,
+)
+
+# --- Configuration ---
+HORIZONS = (7, 14, 30) # Errors are reported over the first h days after each cutoff
+CUTOFFS = 4 # Rolling origins per market
+CUTOFF_PERIOD_DAYS = 30 # Spacing between origins, counted back from the latest one that leaves a full horizon
+METRICS = ('mape', 'rmse')
+# Candidate Prophet settings: seasonality mode x trend flexibility (Prophet's default changepoint_prior_scale is 0.05)
+CANDIDATE_CONFIGS = {
+    f"{mode}_cps{scale}": {**PROPHET_KWARGS, 'seasonality_mode': mode, 'changepoint_prior_scale': scale}
+    for mode in ('multiplicative', 'additive')
+    for scale in (0.01, 0.05, 0.5)
+}
+
+
+def rolling_cutoffs(dates, horizon, cutoffs=CUTOFFS, period_days=CUTOFF_PERIOD_DAYS, min_rows=MIN_ROWS):
+    """
+    Returns up to `cutoffs` origins for a series with the given dates, oldest first.
+    The latest leaves `horizon` days of data after it; earlier ones step back period_days
+    at a time, as long as at least min_rows days remain to train on.
+    """
+    dates = pd.Series(pd.to_datetime(dates)).sort_values()
+    latest = dates.iloc[-1] - pd.Timedelta(days=horizon)
+    origins = [latest - pd.Timedelta(days=period_days * i) for i in range(cutoffs)]
+    return sorted(cutoff for cutoff in origins if (dates <= cutoff).sum() >= min_rows)
+
+
+def backtest_fold(df_prophet, cutoff, prophet_kwargs, horizon):
+    """
+    Fits one model on the (ds, y) rows up to cutoff and forecasts the trading days of the
+    following `horizon` days. Runs inside a worker process.
+    Returns (days after the cutoff, actual prices, forecast prices) as NumPy arrays.
+    """
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING) # Stan logs every fit otherwise
+
+    train = df_prophet[df_prophet['ds'] <= cutoff]
+    test = df_prophet[(df_prophet['ds'] > cutoff) & (df_prophet['ds'] <= cutoff + pd.Timedelta(days=horizon))]
+    # Only yhat is scored, so skip Prophet's uncertainty sampling
+    m = Prophet(**{**prophet_kwargs, 'uncertainty_samples': 0})
+    m.fit(train)
+    yhat = m.predict(test[['ds']])['yhat'].to_numpy()
+    return (test['ds'] - cutoff).dt.days.to_numpy(), test['y'].to_numpy(dtype=float), yhat
+
+
+def horizon_metrics(days_ahead, y, yhat, horizons=HORIZONS):
+    """
+    Returns {h: {'mape': ..., 'rmse': ..., 'points': n}} over the forecasts at most h days
+    after their cutoff. MAPE is in percent and ignores zero prices.
+    """
+    metrics = {}
+    for h in horizons:
+        within = days_ahead <= h
+        errors = yhat[within] - y[within]
+        nonzero = y[within] != 0
+        metrics[h] = {
+            'mape': float(np.mean(np.abs(errors[nonzero] / y[within][nonzero])) * 100) if nonzero.any() else None,
+            'rmse': float(np.sqrt(np.mean(errors ** 2))) if len(errors) else None,
+            'points': int(within.sum()),
+        }
+    return metrics
+
+
+def select_config(metrics_by_config, horizon, metric='mape'):
+    """
+    Returns the name of the configuration with the lowest `metric` at `horizon`,
+    or None if no configuration could be scored.
+    """
+    scored = {
+        name: metrics[horizon][metric] for name, metrics in metrics_by_config.items()
+        if metrics.get(horizon, {}).get(metric) is not None
+    }
+    return min(scored, key=scored.get) if scored else None
+
+
+def run_backtests(series_by_key, configs=None, horizons=HORIZONS, cutoffs=CUTOFFS, period_days=CUTOFF_PERIOD_DAYS,
+                  workers=None):
+    """
+    Backtests every configuration on every series, with all (series, configuration, cutoff)
+    fits spread over a process pool rather than refitting one cutoff after another.
+    Returns {model_key: {config name: horizon_metrics(...)}}; failed folds are reported and left out.
+    """
+    configs = configs or CANDIDATE_CONFIGS
+    horizon = max(horizons)
+    workers = workers or os.cpu_count() or 1
+    folds = {} # (model_key, config name) -> list of fold results
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for model_key, df_prophet in series_by_key.items():
+            for cutoff in rolling_cutoffs(df_prophet['ds'], horizon, cutoffs, period_days):
+                for name, prophet_kwargs in configs.items():
+                    future = executor.submit(backtest_fold, df_prophet, cutoff, prophet_kwargs, horizon)
+                    futures[future] = (model_key, name, cutoff)
+        print(f"Backtesting {len(futures)} fits ({len(series_by_key)} markets x {len(configs)} configurations) "
+              f"on {workers} processes...")
+        for future in as_completed(futures):
+            model_key, name, cutoff = futures[future]
+            try:
+                folds.setdefault((model_key, name), []).append(future.result())
+            except Exception as e:
+                print(f"  Error backtesting {model_key} with {name} at {cutoff.date()}: {e}")
+
+    results = {}
+    for (model_key, name), fold_results in folds.items():
+        days_ahead, y, yhat = (np.concatenate(arrays) for arrays in zip(*fold_results))
+        results.setdefault(model_key, {})[name] = horizon_metrics(days_ahead, y, yhat, horizons)
+    return results
+
+
+def backtest_all(file_paths, state=None, output_dir='.', configs=None, horizons=HORIZONS, cutoffs=CUTOFFS,
+                 period_days=CUTOFF_PERIOD_DAYS, metric='mape', workers=None, all_groups=False,
+                 aggregate=DEFAULT_AGGREGATE, fill='none', max_gap_days=None, cache_dir=SERIES_CACHE_DIR):
+    """
+    Backtests the candidate configurations for every market trained into output_dir
+    (every group with enough rows if all_groups) and records the winner, by `metric`
+    at the longest horizon, as the market's selected_config in the training manifest.
+    train_models.py fits each market with its selected configuration from then on.
+    Returns {model_key: {config name: metrics}}.
+    """
+    df = load_daily_series(file_paths, state, aggregate=aggregate, fill=fill, max_gap_days=max_gap_days,
+                           cache_dir=cache_dir)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    manifest = load_manifest(manifest_path)
+
+    series_by_key = {}
+    for model_key, group in df.groupby(GROUP_COLUMNS, sort=True):
+        if not all_groups and model_basename(model_key) not in manifest['models']:
+            continue
+        df_prophet = group[['Date', 'Modal_Price_Rs']].rename(columns={'Date': 'ds', 'Modal_Price_Rs': 'y'})
+        series_by_key[model_key] = df_prophet.reset_index(drop=True)
+    if not series_by_key:
+        print(f"No trained markets to backtest in '{output_dir}' (use --all-groups to backtest untrained ones).")
+        return {}
+
+    started = time.perf_counter()
+    results = run_backtests(series_by_key, configs, horizons, cutoffs, period_days, workers)
+    print(f"Backtested {len(results)} markets in {time.perf_counter() - started:.1f}s")
+
+    configs = configs or CANDIDATE_CONFIGS
+    horizon = max(horizons)
+    for model_key, metrics_by_config in sorted(results.items()):
+        winner = select_config(metrics_by_config, horizon, metric)
+        print_comparison(model_key, metrics_by_config, horizons, winner)
+        if winner is None:
+            continue
+        entry = manifest['models'].setdefault(model_basename(model_key), {'key': list(model_key)})
+        entry['selected_config'] = {
+            'name': winner,
+            'prophet_kwargs': configs[winner],
+            'metric': metric,
+            'horizon_days': horizon,
+            'metrics': {name: {str(h): values for h, values in metrics.items()} for name, metrics in metrics_by_config.items()},
+            'evaluated_at': datetime.now().isoformat(timespec='seconds'),
+        }
+    save_manifest(manifest, manifest_path)
+    return results
+
+
+def format_metric(value, digits):
+    return '-' if value is None else f"{value:.{digits}f}"
+
+
+def print_comparison(model_key, metrics_by_config, horizons, winner):
+    """
+    Prints one row per configuration with its MAPE (%) and RMSE (Rs./Quintal) at each horizon.
+    """
+    print(f"\n{model_key}")
+    header = ''.join(f"{f'MAPE@{h}d':>10}{f'RMSE@{h}d':>10}" for h in horizons)
+    print(f"  {'config':<24}{header}")
+    for name, metrics in sorted(metrics_by_config.items()):
+        row = ''.join(
+            f"{format_metric(metrics[h]['mape'], 2):>10}{format_metric(metrics[h]['rmse'], 1):>10}" for h in horizons
+        )
+        marker = ' *' if name == winner else ''
+        print(f"  {name:<24}{row}{marker}")
+
+
+# --- Command line interface ---
+# Example: python backtest.py cleaned_historical_agmarknet_data_mp_ratlam.csv --state "Madhya Pradesh"
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of Prophet configurations per market.")
+    parser.add_argument('files', nargs='+', help="Price CSV files (raw or cleaned) or Parquet dataset directories")
+    parser.add_argument('--state', help="State to use for files without a State column")
+    parser.add_argument('--output-dir', default='.', help="Directory of the trained models and their manifest (default: .)")
+    parser.add_argument('--configs', help=f"Comma-separated subset of: {', '.join(CANDIDATE_CONFIGS)}")
+    parser.add_argument('--horizons', default=','.join(map(str, HORIZONS)),
+                        help=f"Comma-separated horizons in days (default: {','.join(map(str, HORIZONS))})")
+    parser.add_argument('--cutoffs', type=int, default=CUTOFFS, help=f"Rolling origins per market (default: {CUTOFFS})")
+    parser.add_argument('--period-days', type=int, default=CUTOFF_PERIOD_DAYS,
+                        help=f"Days between origins (default: {CUTOFF_PERIOD_DAYS})")
+    parser.add_argument('--metric', choices=METRICS, default='mape', help="Metric used to pick the winner (default: mape)")
+    parser.add_argument('--workers', type=int, help="Number of processes (default: number of cores)")
+    parser.add_argument('--all-groups', action='store_true', help="Also backtest markets without a trained model")
+    parser.add_argument('--aggregate', choices=AGGREGATORS, default=DEFAULT_AGGREGATE,
+                        help=f"How same-day rows are combined into one price (default: {DEFAULT_AGGREGATE})")
+    parser.add_argument('--fill', choices=FILL_METHODS, default='none', help="How days without trading are filled (default: none)")
+    parser.add_argument('--max-gap-days', type=int, help="Fill at most this many consecutive missing days")
+    parser.add_argument('--no-series-cache', action='store_true', help=f"Do not read or write the {SERIES_CACHE_DIR} cache")
+    parser.add_argument('--report', help="Also write the full results to this JSON file")
+    args = parser.parse_args()
+
+    configs = None
+    if args.configs:
+        unknown = [name for name in args.configs.split(',') if name not in CANDIDATE_CONFIGS]
+        if unknown:
+            parser.error(f"Unknown configurations: {', '.join(unknown)}")
+        configs = {name: CANDIDATE_CONFIGS[name] for name in args.configs.split(',')}
+    horizons = tuple(sorted(int(h) for h in args.horizons.split(',')))
+
+    results = backtest_all(args.files, state=args.state, output_dir=args.output_dir, configs=configs,
+                           horizons=horizons, cutoffs=args.cutoffs, period_days=args.period_days,
+                           metric=args.metric, workers=args.workers, all_groups=args.all_groups,
+                           aggregate=args.aggregate, fill=args.fill, max_gap_days=args.max_gap_days,
+                           cache_dir=None if args.no_series_cache else SERIES_CACHE_DIR)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump([{'key': list(model_key), 'metrics': {name: {str(h): values for h, values in metrics.items()}
+                                                            for name, metrics in by_config.items()}}
+                       for model_key, by_config in sorted(results.items())], f, indent=2)
+        print(f"Report written to {args.report}")
@@ -0,0 +1,320 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import requests
+
+# --- Configuration ---
+BASE_URL = "http://127.0.0.1:5000" # A local server, e.g. python app.py or uvicorn asgi_app:app --port 5000
+MIX_FILE = "benchmark_requests.jsonl" # One request per line, see load_mix
+RESULTS_FILE = "benchmark_results.json"
+HORIZONS = [7, 14, 30, 60, 90] # Horizons used by the synthetic mix
+PERCENTILES = [50, 95, 99]
+
+
+# --- Request mix ---
+def load_mix(path):
+    """
+    Loads a request mix: one JSON object per line with "method" (default GET), "path",
+    optional "params" (query string) and "json" (body), and an optional "endpoint" label
+    used to group the results (default: the path). Blank lines and lines starting with # are skipped.
+    """
+    mix = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            entry = json.loads(line)
+            if 'path' not in entry:
+                raise ValueError(f"{path}:{line_number}: every request needs a 'path'.")
+            entry.setdefault('method', 'GET')
+            entry.setdefault('endpoint', entry['path'])
+            mix.append(entry)
+    return mix
+
+
+def model_keys_from_server(session, base_url):
+    """
+    Returns the (commodity, state, district, market) keys the server has models for.
+    """
+    response = session.get(f"{base_url}/options", params={'view': 'tree'}, timeout=30)
+    response.raise_for_status()
+    hierarchy = response.json()['hierarchy']
+    return [
+        (commodity, state, district, market)
+        for commodity, states in hierarchy.items()
+        for state, districts in states.items()
+        for district, markets in districts.items()
+        for market in markets
+    ]
+
+
+def synthetic_mix(model_keys, count, options_ratio=0.1, batch_ratio=0.05, columnar_ratio=0.0,
+                  horizons=HORIZONS, batch_size=10, seed=0):
+    """
+    Builds a random request mix over model_keys: mostly /predict with random horizons,
+    plus the given share of /options (half of them filtered by state) and /predict/batch calls.
+    """
+    rng = random.Random(seed)
+    fields = ('commodity', 'state', 'district', 'market')
+    mix = []
+    for _ in range(count):
+        draw = rng.random()
+        if draw < options_ratio:
+            params = {'state': rng.choice(model_keys)[1]} if rng.random() < 0.5 else {}
+            mix.append({'method': 'GET', 'path': '/options', 'params': params, 'endpoint': '/options'})
+        elif draw < options_ratio + batch_ratio:
+            items = [dict(zip(fields, rng.choice(model_keys)), days=rng.choice(horizons)) for _ in range(batch_size)]
+            mix.append({'method': 'POST', 'path': '/predict/batch', 'json': {'requests': items}, 'endpoint': '/predict/batch'})
+        else:
+            params = dict(zip(fields, rng.choice(model_keys)), days=rng.choice(horizons))
+            endpoint = '/predict'
+            if rng.random() < columnar_ratio:
+                params['format'] = 'columnar'
+                endpoint = '/predict?format=columnar'
+            mix.append({'method': 'GET', 'path': '/predict', 'params': params, 'endpoint': endpoint})
+    return mix
+
+
+def save_mix(mix, path):
+    with open(path, 'w') as f:
+        for entry in mix:
+            f.write(json.dumps(entry) + '\n')
+
+
+# --- HTTP replay ---
+def replay(base_url, mix, concurrency=8, repeat=1, warmup=0):
+    """
+    Sends the mix `repeat` times from `concurrency` threads, after `warmup` unrecorded requests.
+    Returns (samples, wall_seconds), where each sample is (endpoint, status, seconds);
+    status is None for requests that failed without an HTTP response.
+    """
+    local = threading.local()
+
+    def send(entry):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.request(entry['method'], base_url + entry['path'], params=entry.get('params'),
+                                       json=entry.get('json'), timeout=60)
+            response.content # Include reading the body in the latency
+            status = response.status_code
+        except requests.exceptions.RequestException:
+            status = None
+        return entry['endpoint'], status, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, mix[:warmup]))
+        started = time.perf_counter()
+        samples = list(executor.map(send, mix * repeat))
+        wall_seconds = time.perf_counter() - started
+    return samples, wall_seconds
+
+
+def latency_summary(seconds):
+    """
+    Returns count, mean, max and percentile latencies in milliseconds.
+    """
+    millis = np.asarray(seconds) * 1000
+    summary = {'count': int(len(millis))}
+    if len(millis):
+        summary['mean_ms'] = round(float(millis.mean()), 3)
+        summary['max_ms'] = round(float(millis.max()), 3)
+        for p, value in zip(PERCENTILES, np.percentile(millis, PERCENTILES)):
+            summary[f'p{p}_ms'] = round(float(value), 3)
+    return summary
+
+
+def summarize(samples, wall_seconds):
+    """
+    Groups the samples by endpoint into latency percentiles, throughput and status counts.
+    """
+    by_endpoint = {}
+    for endpoint, status, seconds in samples:
+        by_endpoint.setdefault(endpoint, []).append((status, seconds))
+
+    endpoints = {}
+    for endpoint, results in sorted(by_endpoint.items()):
+        statuses = {}
+        for status, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        summary = latency_summary([seconds for _, seconds in results])
+        summary['throughput_rps'] = round(len(results) / wall_seconds, 2) if wall_seconds else None
+        summary['errors'] = sum(1 for status, _ in results if status is None or status >= 500)
+        summary['status_counts'] = statuses
+        endpoints[endpoint] = summary
+
+    overall = latency_summary([seconds for _, _, seconds in samples])
+    overall['throughput_rps'] = round(len(samples) / wall_seconds, 2) if wall_seconds else None
+    overall['errors'] = sum(summary['errors'] for summary in endpoints.values())
+    overall['wall_seconds'] = round(wall_seconds, 3)
+    return {'overall': overall, 'endpoints': endpoints}
+
+
+# --- In-process stage timings ---
+def time_call(function, repeat=1):
+    """
+    Calls function `repeat` times and returns (last result, median seconds per call).
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return result, statistics.median(timings)
+
+
+def stage_timings(model_dir='.', days=30, max_models=None, repeat=20):
+    """
+    Times the serving stages of app.py in this process, without HTTP, for each model in model_dir:
+    model load, forecast computation, forecast cache lookup and serialization.
+    "cold" is the first call on a fresh registry/cache; "warm" is the median of `repeat` later calls.
+    Returns per-stage summaries (milliseconds) across models.
+    """
+    import app
+    from forecast_cache import ForecastCache
+    from model_registry import ModelRegistry
+
+    registry = ModelRegistry(model_dir, max_resident=max(len(os.listdir(model_dir)), 1))
+    model_keys = registry.keys()[:max_models] if max_models else registry.keys()
+    stages = {}
+
+    def record(stage, seconds):
+        stages.setdefault(stage, []).append(seconds)
+
+    for model_key in model_keys:
+        model, seconds = time_call(lambda: registry.get(model_key))
+        record('model_load_cold', seconds)
+        _, seconds = time_call(lambda: registry.get(model_key), repeat)
+        record('model_load_warm', seconds)
+
+        forecast, seconds = time_call(lambda: app.compute_forecast(model, app.MAX_FORECAST_DAYS))
+        record('predict_cold', seconds)
+        _, seconds = time_call(lambda: app.compute_forecast(model, app.MAX_FORECAST_DAYS), repeat)
+        record('predict_warm', seconds)
+
+        cache = ForecastCache()
+        cache_key = (model_key, registry.fingerprint(model_key), app.last_history_date(model))
+        _, seconds = time_call(lambda: cache.get_or_compute(cache_key, lambda: forecast).head(days), repeat)
+        record('cache_hit', seconds)
+
+        sliced = forecast.head(days)
+        _, seconds = time_call(lambda: app.forecast_to_records(sliced))
+        record('serialize_records_cold', seconds)
+        _, seconds = time_call(lambda: app.forecast_to_records(sliced), repeat)
+        record('serialize_records_warm', seconds)
+        _, seconds = time_call(lambda: app.forecast_to_columns(sliced), repeat)
+        record('serialize_columnar_warm', seconds)
+        with app.app.app_context():
+            records = app.forecast_to_records(sliced)
+            _, seconds = time_call(lambda: app.app.json.dumps(records), repeat)
+        record('json_encode_warm', seconds)
+
+    return {stage: latency_summary(seconds) for stage, seconds in stages.items()}
+
+
+# --- Results ---
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(previous, current):
+    """
+    Prints the change in p50/p95/p99 latency per endpoint and stage against a previous results file.
+    """
+    print(f"\nCompared with {previous.get('commit') or 'previous run'} ({previous.get('started_at')}):")
+    sections = [('endpoints', previous.get('http', {}).get('endpoints', {}), current.get('http', {}).get('endpoints', {})),
+                ('stages', previous.get('stages', {}), current.get('stages', {}))]
+    for section, before_items, after_items in sections:
+        for name in sorted(set(before_items) & set(after_items)):
+            changes = []
+            for p in PERCENTILES:
+                before = before_items[name].get(f'p{p}_ms')
+                after = after_items[name].get(f'p{p}_ms')
+                if before and after is not None:
+                    changes.append(f"p{p} {before:.2f} -> {after:.2f} ms ({(after - before) / before * 100:+.1f}%)")
+            if changes:
+                print(f"  {section[:-1]} {name}: " + ", ".join(changes))
+
+
+def print_summary(summary, title):
+    print(f"\n{title}")
+    for name, stats in summary.items():
+        percentiles = " ".join(f"p{p}={stats.get(f'p{p}_ms', float('nan')):.2f}ms" for p in PERCENTILES)
+        extra = f" {stats['throughput_rps']} req/s, {stats['errors']} errors" if 'throughput_rps' in stats else ""
+        print(f"  {name:<28} n={stats['count']:<6} {percentiles}{extra}")
+
+
+# --- Command line interface ---
+# Example:
+#   python benchmark.py --generate 500          # write a synthetic mix from the server's models
+#   python benchmark.py --concurrency 16 --repeat 3 --stages --compare benchmark_results_main.json
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a request mix against the prediction API and report latencies.")
+    parser.add_argument('--base-url', default=BASE_URL, help=f"Server to benchmark (default: {BASE_URL})")
+    parser.add_argument('--mix', default=MIX_FILE, help=f"Request mix JSONL file (default: {MIX_FILE})")
+    parser.add_argument('--generate', type=int, metavar='N', help="Write a synthetic mix of N requests to --mix first")
+    parser.add_argument('--options-ratio', type=float, default=0.1, help="Share of /options requests in a generated mix")
+    parser.add_argument('--batch-ratio', type=float, default=0.05, help="Share of /predict/batch requests in a generated mix")
+    parser.add_argument('--columnar-ratio', type=float, default=0.0, help="Share of /predict requests using format=columnar")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent client threads (default: 8)")
+    parser.add_argument('--repeat', type=int, default=1, help="Replay the mix this many times")
+    parser.add_argument('--warmup', type=int, default=0, help="Send the first N requests once, unrecorded, before measuring")
+    parser.add_argument('--no-http', action='store_true', help="Skip the HTTP replay")
+    parser.add_argument('--stages', action='store_true', help="Also time model load, predict and serialization in-process")
+    parser.add_argument('--model-dir', default='.', help="Model directory for --stages (default: .)")
+    parser.add_argument('--output', default=RESULTS_FILE, help=f"Where to write the results JSON (default: {RESULTS_FILE})")
+    parser.add_argument('--compare', help="Previous results JSON to compare against")
+    args = parser.parse_args()
+
+    results = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+    }
+
+    if args.generate:
+        with requests.Session() as session:
+            model_keys = model_keys_from_server(session, args.base_url)
+        if not model_keys:
+            print("The server has no models to benchmark.")
+            exit(1)
+        save_mix(synthetic_mix(model_keys, args.generate, args.options_ratio, args.batch_ratio,
+                               args.columnar_ratio, seed=args.seed), args.mix)
+        print(f"Wrote {args.generate} requests over {len(model_keys)} models to {args.mix}")
+
+    if not args.no_http:
+        mix = load_mix(args.mix)
+        print(f"Replaying {len(mix)} requests x{args.repeat} against {args.base_url} with {args.concurrency} threads...")
+        samples, wall_seconds = replay(args.base_url, mix, args.concurrency, args.repeat, args.warmup)
+        results['http'] = summarize(samples, wall_seconds)
+        print_summary(results['http']['endpoints'], "Latency per endpoint:")
+        print_summary({'overall': results['http']['overall']}, "Overall:")
+
+    if args.stages:
+        results['stages'] = stage_timings(args.model_dir)
+        print_summary(results['stages'], "Serving stages (in-process):")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare_results(json.load(f), results)
@@ -0,0 +1,80 @@
+import sys
+
+import numpy as np
+
+from forecast_engine import ForecastEngine, extract_forecast_params, sampled_interval_offsets
+
+# Bump this whenever the set or meaning of the stored arrays changes.
+# Version 2 added the optional precomputed interval offsets; version 1 files still load.
+COMPACT_FORMAT_VERSION = 2
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+COMPACT_SUFFIX = '.npz'
+# Days of Prophet-sampled interval bounds stored with each model, the longest horizon index.html offers
+INTERVAL_DAYS = 90
+
+
+def export_compact_model(m, path, interval_days=INTERVAL_DAYS):
+    """
+    Writes the fitted parameters of a Prophet model `m` to a slim, versioned .npz artifact.
+
+    Only what a forecast needs is kept: the trend changepoints and rates, the seasonality
+    coefficients, the noise scale and the last history date. The history DataFrame,
+    the Stan fit and any posterior samples are dropped.
+    The interval bounds Prophet samples for the next `interval_days` days are stored as
+    offsets from yhat, so they can be served without sampling (0 skips them).
+    Only linear-growth models without holidays or extra regressors are supported.
+    """
+    params = extract_forecast_params(m)
+    intervals = {}
+    if interval_days:
+        lower_offsets, upper_offsets = sampled_interval_offsets(m, interval_days)
+        intervals = {'interval_lower_offsets': lower_offsets, 'interval_upper_offsets': upper_offsets}
+    np.savez_compressed(
+        path,
+        format_version=np.array(COMPACT_FORMAT_VERSION),
+        y_scale=np.array(params['y_scale'], dtype=float),
+        floor=np.array(params['floor'], dtype=float),
+        start_days=np.array(params['start_days'], dtype=float),
+        t_scale_days=np.array(params['t_scale_days'], dtype=float),
+        last_history_date=np.array(params['last_history_date'], dtype='datetime64[D]'),
+        changepoints_t=params['changepoints_t'],
+        k=np.array(params['k'], dtype=float),
+        m=np.array(params['m'], dtype=float),
+        delta=params['delta'],
+        sigma_obs=np.array(params['sigma_obs'], dtype=float),
+        beta=params['beta'],
+        seasonality_names=np.array(params['seasonality_names'], dtype=str),
+        seasonality_periods=np.array(params['seasonality_periods'], dtype=float),
+        seasonality_orders=np.array(params['seasonality_orders'], dtype=int),
+        seasonality_modes=np.array(params['seasonality_modes'], dtype=str),
+        interval_width=np.array(params['interval_width'], dtype=float),
+        **intervals,
+    )
+
+
+def load_compact_model(path):
+    """
+    Loads a compact model artifact written by export_compact_model as a ForecastEngine,
+    without importing Prophet or cmdstanpy.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+
+    version = int(arrays.pop('format_version'))
+    if version not in SUPPORTED_FORMAT_VERSIONS:
+        raise ValueError(f"Unsupported compact model format version {version} in '{path}'.")
+    return ForecastEngine(**arrays)
+
+
+# --- Convert existing pickled models ---
+# Usage: python compact_model.py prophet_model_*.pkl
+if __name__ == '__main__':
+    import joblib
+
+    for pkl_path in sys.argv[1:]:
+        npz_path = pkl_path[:-len('.pkl')] + COMPACT_SUFFIX if pkl_path.endswith('.pkl') else pkl_path + COMPACT_SUFFIX
+        try:
+            export_compact_model(joblib.load(pkl_path), npz_path)
+            print(f"Compact model saved to {npz_path}")
+        except Exception as e:
+            print(f"Error exporting '{pkl_path}': {e}")
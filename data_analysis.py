@@ -1,15 +1,15 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-# Define the filename of the cleaned CSV
-file_path = "cleaned_historical_agmarknet_data.csv" 
+from price_cleaning import clean_file
+
+# Define the filename of the raw Agmarknet export
+# The shared cleaning library reads it directly, so no intermediate cleaned CSV is needed.
+file_path = "historical_crop_data_wheat_madhay_pradesh_ratlam.csv" 
 
 try:
-    df = pd.read_csv(file_path)
-    # Ensure 'Date' column is in datetime format, as it might be read as object after saving/loading
-    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-    print("Cleaned data loaded successfully for further processing.")
+    df = clean_file(file_path)
+    print("Data loaded and cleaned successfully for further processing.")
 except FileNotFoundError:
     print(f"Error: The file {file_path} was not found. Please check the file name and path.")
     exit()
@@ -32,7 +32,7 @@ print(df.isnull().sum())
 price_cols = ['Min_Price_Rs', 'Max_Price_Rs', 'Modal_Price_Rs']
 for col in price_cols:
     if col in df.columns:
-        df[col] = df[col].fillna(method='ffill')
+        df[col] = df[col].ffill()
 
 # Drop any rows where 'Date' or critical price columns are still NaN after filling
 df.dropna(subset=['Date'] + price_cols, inplace=True)
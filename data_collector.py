@@ -1,112 +1,220 @@
-import requests
+import argparse
+import json
 import os
-import pandas as pd
-from dotenv import load_dotenv
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from price_dataset import DATASET_DIR, append_page, read_partitions, records_to_frame
 
 # --- Configuration ---
 load_dotenv()
-api_key = os.getenv("API_KEY")
 
-if not api_key:
-    print("Error: API_KEY not found in .env file. Please check your .env file.")
-    exit()
-
-BASE_URL = "https://api.data.gov.in/resource/9ef84268-d588-465a-a308-a864a43d0070"
+# Overridable so the collector can be pointed at a local stub server
+BASE_URL = os.getenv("DATA_GOV_BASE_URL", "https://api.data.gov.in/resource/9ef84268-d588-465a-a308-a864a43d0070")
 
 # Target crop and state for data collection
-# We will use these to filter the data AFTER fetching it
-TARGET_CROP = "Wheat"  
-TARGET_STATE = "Uttar Pradesh" 
+# These are sent to the API as filters so only matching records are downloaded
+TARGET_CROP = "Wheat"
+TARGET_STATE = "Uttar Pradesh"
 
 LIMIT_PER_REQUEST = 500
-TOTAL_RECORDS_TO_FETCH = 10000 
-
-all_records = []
-offset = 0
-
-print(f"Starting unfiltered data collection...")
-print(f"Fetching up to {TOTAL_RECORDS_TO_FETCH} records, {LIMIT_PER_REQUEST} per request.")
-
-# --- Data Fetching Loop (UNFILTERED) ---
-while offset < TOTAL_RECORDS_TO_FETCH:
+TOTAL_RECORDS_TO_FETCH = 10000
+
+MAX_WORKERS = 4 # Pages fetched concurrently
+REQUESTS_PER_SECOND = 2.0 # Shared across all workers
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0 # Doubled after every failed attempt
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    Spaces out calls across threads so no more than `rate` requests start per second.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_session(pool_size):
+    """
+    Returns a requests.Session whose connection pool is large enough for all workers.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_page(session, limiter, base_url, api_key, offset, limit, filters):
+    """
+    Fetches one page of records, retrying with exponential backoff on network errors,
+    rate limiting (429) and server errors. Returns the list of records on the page.
+    """
     params = {
         "api-key": api_key,
         "format": "json",
         "offset": offset,
-        "limit": LIMIT_PER_REQUEST,
+        "limit": limit,
     }
+    for field, value in filters.items():
+        params[f"filters[{field}]"] = value
+
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.wait()
+        delay = BACKOFF_SECONDS * (2 ** attempt)
+        try:
+            response = session.get(base_url, params=params, timeout=30)
+            if response.status_code not in RETRY_STATUS_CODES:
+                response.raise_for_status()
+                return response.json().get('records', [])
+            # Honour the server's Retry-After hint when it sends one
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            error = f"HTTP {response.status_code}"
+        except requests.exceptions.HTTPError:
+            raise # Client errors such as a bad API key will not succeed on retry
+        except requests.exceptions.RequestException as req_err:
+            error = str(req_err)
+
+        if attempt < MAX_RETRIES:
+            print(f"  Offset {offset}: {error}. Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+    raise requests.exceptions.RetryError(f"Giving up on offset {offset} after {MAX_RETRIES} retries: {error}")
+
+
+def load_checkpoint(checkpoint_path, filters):
+    """
+    Returns (offset to resume from, pull id) from the checkpoint, or (0, None) if there is
+    no checkpoint for these filters.
+    """
+    if not os.path.exists(checkpoint_path):
+        return 0, None
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('filters') != filters:
+        print(f"Ignoring checkpoint {checkpoint_path}: it was written for different filters.")
+        return 0, None
+    return checkpoint['next_offset'], checkpoint['pull_id']
+
+
+def save_checkpoint(checkpoint_path, filters, next_offset, pull_id):
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'filters': filters, 'next_offset': next_offset, 'pull_id': pull_id}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def collect_records(api_key, filters, dataset_dir, checkpoint_path, base_url=BASE_URL,
+                    max_records=TOTAL_RECORDS_TO_FETCH, limit=LIMIT_PER_REQUEST,
+                    workers=MAX_WORKERS, rate=REQUESTS_PER_SECOND):
+    """
+    Downloads all records matching `filters`, `workers` pages at a time, streaming each page
+    into the partitioned Parquet dataset as typed columns instead of holding the pull in memory.
+
+    Pages are written in offset order and the next offset is checkpointed after each one,
+    so a crashed or interrupted run resumes where it stopped.
+    Returns the number of records stored.
+    """
+    offset, pull_id = load_checkpoint(checkpoint_path, filters)
+    if pull_id is None:
+        pull_id = f"pull-{time.strftime('%Y%m%d%H%M%S')}"
+    elif offset:
+        print(f"Resuming from checkpoint at offset {offset}.")
+
+    stored = 0
+    limiter = RateLimiter(rate)
+    fetch = lambda page_offset: fetch_page(session, limiter, base_url, api_key, page_offset, limit, filters)
+    with make_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+        finished = False
+        while offset < max_records and not finished:
+            # Fetch the next window of pages concurrently; map() yields them back in offset order
+            offsets = [o for o in range(offset, offset + workers * limit, limit) if o < max_records]
+            for page_offset, records in zip(offsets, executor.map(fetch, offsets)):
+                if not records:
+                    print(f"No more records found or end of data at offset {page_offset}. Stopping.")
+                    finished = True
+                    break
+
+                page = records_to_frame(records)
+                # The API already filtered by crop and state; this guards against loose server-side matching
+                page = page[(page['State'] == filters['state']) & (page['Commodity'] == filters['commodity'])]
+                append_page(page, dataset_dir, page_id=f"{pull_id}-{page_offset}")
+                stored += len(page)
+
+                offset = page_offset + limit
+                save_checkpoint(checkpoint_path, filters, offset, pull_id)
+                print(f"Fetched {len(records)} records ({len(page)} stored). Current offset: {page_offset}")
+                if len(records) < limit:
+                    finished = True # A short page is the last one
+                    break
+    return stored
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Collect mandi prices from the data.gov.in API.")
+    parser.add_argument('--crop', default=TARGET_CROP)
+    parser.add_argument('--state', default=TARGET_STATE)
+    parser.add_argument('--base-url', default=BASE_URL, help="API endpoint (e.g. a local stub server)")
+    parser.add_argument('--dataset-dir', default=DATASET_DIR, help=f"Parquet dataset to append to (default: {DATASET_DIR})")
+    parser.add_argument('--max-records', type=int, default=TOTAL_RECORDS_TO_FETCH)
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND, help="Max requests per second")
+    parser.add_argument('--restart', action='store_true', help="Ignore any checkpoint and start from offset 0")
+    parser.add_argument('--no-csv', action='store_true', help="Only update the Parquet dataset, skip the CSV export")
+    args = parser.parse_args()
+
+    api_key = os.getenv("API_KEY")
+    if not api_key:
+        print("Error: API_KEY not found in .env file. Please check your .env file.")
+        exit()
+
+    output_filename = f"historical_crop_data_{args.crop.lower().replace(' ', '_')}_{args.state.lower().replace(' ', '_')}.csv"
+    checkpoint_path = output_filename + '.checkpoint.json'
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    filters = {'state': args.state, 'commodity': args.crop}
+    print(f"Starting data collection for {args.crop} in {args.state}...")
+    print(f"Fetching up to {args.max_records} records, {LIMIT_PER_REQUEST} per request, {args.workers} requests at a time.")
 
     try:
-        response = requests.get(BASE_URL, params=params, timeout=30)
-        response.raise_for_status() 
-        
-        data = response.json()
-        records = data.get('records', [])
-
-        if not records:
-            print(f"No more records found or end of data at offset {offset}. Stopping.")
-            break
-
-        all_records.extend(records)
-        print(f"Fetched {len(records)} records. Total collected: {len(all_records)}. Current offset: {offset}")
-
-        offset += LIMIT_PER_REQUEST
-        time.sleep(0.5) 
-
+        total = collect_records(api_key, filters, args.dataset_dir, checkpoint_path, base_url=args.base_url,
+                                max_records=args.max_records, workers=args.workers, rate=args.rate)
     except requests.exceptions.RequestException as req_err:
         print(f"An unexpected request error occurred: {req_err}")
-        break
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        break
-
-print(f"\nFinished fetching raw data. Total records collected: {len(all_records)}")
-
-# --- Data Processing and Filtering with Pandas ---
-if all_records:
-    df = pd.DataFrame(all_records)
-    print("\nInitial DataFrame shape (before filtering):", df.shape)
-
-    # Filter the DataFrame to get only the target crop and state
-    # We are now doing the filtering ourselves
-    df_filtered = df[(df['state'] == TARGET_STATE) & (df['commodity'] == TARGET_CROP)]
-    
-    # Standardize column names for easier use
-    column_mapping = {
-        'state': 'State',
-        'district': 'District',
-        'market': 'Market',
-        'commodity': 'Commodity',
-        'variety': 'Variety',
-        'arrival_date': 'Date',
-        'min_price': 'Min_Price_Rs',
-        'max_price': 'Max_Price_Rs',
-        'modal_price': 'Modal_Price_Rs',
-    }
-    df_filtered = df_filtered.rename(columns=column_mapping)
-    
-    # Convert date column to datetime objects
-    if 'Date' in df_filtered.columns:
-        df_filtered['Date'] = pd.to_datetime(df_filtered['Date'], errors='coerce', format='%d/%m/%Y')
-        df_filtered = df_filtered.dropna(subset=['Date'])
-        df_filtered = df_filtered.sort_values(by='Date').reset_index(drop=True)
-
-    # Convert price columns to numeric
-    price_cols = ['Min_Price_Rs', 'Max_Price_Rs', 'Modal_Price_Rs']
-    for col in price_cols:
-        if col in df_filtered.columns:
-            df_filtered[col] = df_filtered[col].astype(str).str.replace(',', '', regex=False)
-            df_filtered[col] = pd.to_numeric(df_filtered[col], errors='coerce')
-    df_filtered = df_filtered.dropna(subset=price_cols)
-
-    print("\nProcessed and Filtered DataFrame head:")
-    print(df_filtered.head())
-    print(f"\nFinal DataFrame shape (after filtering): {df_filtered.shape}")
-
-    # --- Save to CSV ---
-    output_filename = f"historical_crop_data_{TARGET_CROP.lower().replace(' ', '_')}_{TARGET_STATE.lower().replace(' ', '_')}.csv"
-    df_filtered.to_csv(output_filename, index=False)
-    print(f"\nData successfully saved to {output_filename}")
-else:
-    print("No records were collected to process.")
\ No newline at end of file
+        print("Progress was checkpointed; run the collector again to resume.")
+        exit(1)
+
+    # The pull is complete, so the next run starts a new one
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    print(f"\nFinished fetching data. Records stored in {args.dataset_dir}: {total}")
+
+    # --- Export this state and crop to CSV for the existing scripts ---
+    if not args.no_csv and os.path.isdir(args.dataset_dir):
+        df_filtered = read_partitions(args.dataset_dir, state=args.state, commodity=args.crop)
+        df_filtered = df_filtered.drop(columns=['Month'])
+        print("\nProcessed DataFrame head:")
+        print(df_filtered.head())
+        print(f"\nFinal DataFrame shape: {df_filtered.shape}")
+
+        df_filtered.to_csv(output_filename, index=False)
+        print(f"\nData successfully saved to {output_filename}")
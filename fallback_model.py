@@ -0,0 +1,149 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# Bump this whenever the set or meaning of the stored arrays changes.
+FALLBACK_FORMAT_VERSION = 1
+FALLBACK_PREFIX = 'fallback_model_' # Same naming scheme as prophet_model_ files, see model_registry.py
+FALLBACK_SUFFIX = '.npz'
+
+SMOOTHING_LEVELS = np.linspace(0.05, 1.0, 20) # Candidate alphas, the best one-step fit is kept
+MIN_SEASONAL_ROWS = 14 # Fewer observations than this: no day-of-week factors
+DEFAULT_RELATIVE_SD = 0.05 # Noise scale, relative to the level, when there are too few rows to estimate it
+INTERVAL_WIDTH = 0.8 # Same as Prophet's default
+
+
+def day_of_week(dates):
+    """
+    Returns the day of the week of datetime64[D] dates, Monday being 0 (1970-01-01 was a Thursday).
+    """
+    return (dates.astype('datetime64[D]').astype(np.int64) + 3) % 7
+
+
+def weekly_factors(dates, prices):
+    """
+    Multiplicative day-of-week factors: the mean ratio of each day's price to a centered
+    7-observation moving average. Days with fewer than 2 observations keep a factor of 1.
+    """
+    factors = np.ones(7)
+    if len(prices) < MIN_SEASONAL_ROWS:
+        return factors
+    trend = np.convolve(prices, np.ones(7) / 7, mode='valid') # Centered on observations 3 .. n-4
+    ratios = prices[3:len(prices) - 3] / trend
+    weekdays = day_of_week(dates[3:len(prices) - 3])
+    for weekday in range(7):
+        if (weekdays == weekday).sum() >= 2:
+            factors[weekday] = ratios[weekdays == weekday].mean()
+    return factors
+
+
+def smooth(values, alphas=SMOOTHING_LEVELS):
+    """
+    Simple exponential smoothing of `values` for every alpha at once.
+    Returns (final level per alpha, one-step-ahead errors with shape (len(alphas), len(values) - 1)).
+    """
+    level = np.full(len(alphas), values[0], dtype=float)
+    errors = np.empty((len(alphas), len(values) - 1))
+    for i, value in enumerate(values[1:]):
+        errors[:, i] = value - level
+        level = level + alphas * errors[:, i]
+    return level, errors
+
+
+class FallbackForecaster:
+    """
+    Forecaster for markets with too little history for Prophet: simple exponential
+    smoothing of the deseasonalized prices, times day-of-week factors when there are
+    enough rows to estimate them. Fitting is a few vectorized passes over the series.
+
+    Offers the same predict/predict_arrays interface as ForecastEngine, with analytic
+    intervals from the smoothing model's h-step variance, sigma^2 (1 + (h - 1) alpha^2).
+    """
+
+    model_type = 'fallback'
+
+    def __init__(self, last_history_date, level, alpha, sigma, weekly_factors, interval_width=INTERVAL_WIDTH):
+        self.last_history_date = np.datetime64(last_history_date, 'D')
+        self.level = float(level)
+        self.alpha = float(alpha)
+        self.sigma = float(sigma)
+        self.weekly_factors = np.asarray(weekly_factors, dtype=float)
+        self.interval_width = float(interval_width)
+        self.z = NormalDist().inv_cdf(0.5 + self.interval_width / 2)
+
+    @classmethod
+    def fit(cls, dates, prices, interval_width=INTERVAL_WIDTH):
+        """
+        Fits a forecaster on daily prices (at least one row; dates need not be consecutive).
+        """
+        order = np.argsort(np.asarray(dates, dtype='datetime64[D]'))
+        dates = np.asarray(dates, dtype='datetime64[D]')[order]
+        prices = np.asarray(prices, dtype=float)[order]
+        if not len(prices):
+            raise ValueError("Cannot fit a fallback forecaster without any price.")
+
+        factors = weekly_factors(dates, prices)
+        levels, errors = smooth(prices / factors[day_of_week(dates)])
+        best = int(np.argmin((errors ** 2).sum(axis=1))) if errors.shape[1] else len(SMOOTHING_LEVELS) - 1
+        if errors.shape[1] >= 2:
+            sigma = np.sqrt(np.mean(errors[best] ** 2))
+        else:
+            sigma = DEFAULT_RELATIVE_SD * abs(levels[best])
+        return cls(dates[-1], levels[best], SMOOTHING_LEVELS[best], sigma, factors, interval_width)
+
+    def precomputed_days(self):
+        return 0
+
+    def future_dates(self, days):
+        return self.last_history_date + np.arange(1, days + 1)
+
+    def predict_arrays(self, days, interval='analytic', samples=None):
+        """
+        Returns (dates, yhat, yhat_lower, yhat_upper) NumPy arrays for the next `days` days;
+        both bounds are None when interval is 'none'. Every other method gives the analytic bounds.
+        """
+        dates = self.future_dates(days)
+        factors = self.weekly_factors[day_of_week(dates)]
+        yhat = self.level * factors
+        if interval == 'none':
+            return dates, yhat, None, None
+        h = np.arange(1, days + 1, dtype=float)
+        half_width = self.z * self.sigma * np.sqrt(1 + (h - 1) * self.alpha ** 2) * factors
+        return dates, yhat, yhat - half_width, yhat + half_width
+
+    def predict(self, days, interval='analytic', samples=None):
+        """
+        Returns a DataFrame with ds, yhat, yhat_lower and yhat_upper for the next `days` days,
+        the same contract as ForecastEngine.predict.
+        """
+        dates, yhat, yhat_lower, yhat_upper = self.predict_arrays(days, interval, samples)
+        columns = {'ds': dates.astype('datetime64[ns]'), 'yhat': yhat}
+        if yhat_lower is not None:
+            columns.update({'yhat_lower': yhat_lower, 'yhat_upper': yhat_upper})
+        return pd.DataFrame(columns)
+
+    def save(self, path):
+        np.savez(
+            path,
+            format_version=np.array(FALLBACK_FORMAT_VERSION),
+            last_history_date=np.array(self.last_history_date, dtype='datetime64[D]'),
+            level=np.array(self.level),
+            alpha=np.array(self.alpha),
+            sigma=np.array(self.sigma),
+            weekly_factors=self.weekly_factors,
+            interval_width=np.array(self.interval_width),
+        )
+
+
+def load_fallback_model(path):
+    """
+    Loads a forecaster written by FallbackForecaster.save.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+
+    version = int(arrays.pop('format_version'))
+    if version != FALLBACK_FORMAT_VERSION:
+        raise ValueError(f"Unsupported fallback model format version {version} in '{path}'.")
+    return FallbackForecaster(**arrays)
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def model_fingerprint(path):
+    """
+    Returns a cheap fingerprint for a model file, built from its size and modification time.
+    A retrained model written over the same filename gets a new fingerprint.
+    """
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+class ForecastCache:
+    """
+    Thread-safe LRU cache of precomputed forecasts with a time-to-live per entry.
+
+    Keys are tuples whose first element is the model key, e.g.
+    (model_key, model_fingerprint, last_history_date), so all entries of one
+    model can be dropped with invalidate(model_key).
+    """
+
+    def __init__(self, max_entries=128, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key) # Mark as most recently used
+                    self.hits += 1
+                    return value
+                # Expired: drop it and count as a miss
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """
+        Stores value under key, evicting the least recently used entries if the cache is full.
+        """
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value for key, calling compute() and caching its result on a miss.
+        compute() runs outside the lock so a slow forecast does not block other keys.
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, model_key=None):
+        """
+        Drops every cached entry for model_key, or the whole cache if model_key is None.
+        Returns the number of entries removed.
+        """
+        with self._lock:
+            if model_key is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            stale_keys = [key for key in self._entries if key[0] == model_key]
+            for key in stale_keys:
+                del self._entries[key]
+            return len(stale_keys)
+
+    def stats(self):
+        """
+        Returns hit/miss/eviction counters and the current number of entries.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
@@ -0,0 +1,176 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model_registry import ModelRegistry, load_model_file
+
+# Bump this whenever the layout of the index or the data file changes.
+FORECAST_TABLE_VERSION = 1
+FORECAST_TABLE_FILENAME = 'forecast_table.json' # Index; the forecasts live in a .bin file next to it
+TABLE_HORIZONS = (7, 14, 30) # Almost all /predict traffic; longer horizons are forecast live
+TABLE_COLUMNS = ('yhat', 'yhat_lower', 'yhat_upper') # One float64 row of these per model and day
+
+
+def forecast_model_files(paths, days):
+    """
+    Forecasts the next `days` days of each model file, with the bounds interval=auto gives:
+    the ones Prophet sampled at training time when the model stores enough of them, the
+    analytic ones otherwise (see app.resolve_interval). Runs in a worker process.
+    Returns one (model_type, interval_method, first date, (days, 3) array) per path, or None
+    for models only Prophet.predict can serve, which stay live.
+    """
+    results = []
+    for path in paths:
+        m = load_model_file(path)
+        if not hasattr(m, 'predict_arrays'):
+            results.append(None)
+            continue
+        method = 'precomputed' if m.precomputed_days() >= days else 'analytic'
+        dates, yhat, yhat_lower, yhat_upper = m.predict_arrays(days, method)
+        results.append((m.model_type, method, str(dates[0]), np.column_stack([yhat, yhat_lower, yhat_upper])))
+    return results
+
+
+def build_forecast_table(model_dir, table_path=None, horizons=TABLE_HORIZONS, workers=None):
+    """
+    Forecasts every model in model_dir up to the longest of `horizons`, on `workers` processes,
+    and packs the results into one float64 file that ForecastTable memory-maps, rows ordered
+    by model then date, plus a JSON index of each model's first row, first date and the file
+    fingerprint it was computed from.
+
+    Like build_model_store, the data file is named after its content hash and written before
+    the index is replaced, so readers never pair a new index with an old data file.
+    Returns the number of models stored.
+    """
+    table_path = table_path or os.path.join(model_dir, FORECAST_TABLE_FILENAME)
+    days = max(horizons)
+    registry = ModelRegistry(model_dir, max_resident=1)
+    model_keys = registry.keys()
+    paths = [registry.path(model_key) for model_key in model_keys]
+
+    # A few chunks per worker: each forecast takes well under a millisecond, so one task per model would mostly be overhead
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, -(-len(paths) // (workers * 4)))
+    chunks = [paths[start:start + chunk_size] for start in range(0, len(paths), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = [result for chunk in executor.map(forecast_model_files, chunks, [days] * len(chunks)) for result in chunk]
+
+    blocks = []
+    models = {}
+    unsupported = {} # filename -> fingerprint
+    for model_key, path, result in zip(model_keys, paths, results):
+        filename = os.path.basename(path)
+        if result is None:
+            unsupported[filename] = registry.fingerprint(model_key)
+            continue
+        model_type, method, first_date, values = result
+        models[filename] = {
+            'key': list(model_key),
+            'fingerprint': registry.fingerprint(model_key),
+            'row': len(blocks) * days,
+            'first_date': first_date,
+            'model_type': model_type,
+            'interval_method': method,
+        }
+        blocks.append(values)
+
+    data = np.concatenate(blocks) if blocks else np.zeros((0, len(TABLE_COLUMNS)))
+    table_dir = os.path.dirname(os.path.abspath(table_path))
+    data_file = f"{os.path.splitext(os.path.basename(table_path))[0]}-{hashlib.sha256(data.tobytes()).hexdigest()[:16]}.bin"
+    tmp_path = os.path.join(table_dir, f"{data_file}.{os.getpid()}.tmp")
+    data.tofile(tmp_path)
+    os.replace(tmp_path, os.path.join(table_dir, data_file))
+
+    previous_data_file = None
+    if os.path.exists(table_path):
+        with open(table_path) as f:
+            previous_data_file = json.load(f).get('data_file')
+    tmp_path = f"{table_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': FORECAST_TABLE_VERSION, 'data_file': data_file, 'days': days, 'horizons': list(horizons),
+                   'models': models, 'unsupported': unsupported}, f)
+    os.replace(tmp_path, table_path)
+
+    # Processes that mapped the old data file keep their mapping after it is unlinked
+    if previous_data_file and previous_data_file != data_file:
+        try:
+            os.remove(os.path.join(table_dir, previous_data_file))
+        except FileNotFoundError:
+            pass
+    return len(models)
+
+
+class ForecastTable:
+    """
+    Read-only view of a table written by build_forecast_table.
+
+    The data file is memory-mapped, so every worker process reads the same pages and a
+    lookup is a dictionary access plus a slice: no model is loaded and nothing is computed.
+    """
+
+    def __init__(self, table_path):
+        with open(table_path) as f:
+            index = json.load(f)
+        if index.get('version') != FORECAST_TABLE_VERSION:
+            raise ValueError(f"Unsupported forecast table version {index.get('version')} in '{table_path}'.")
+        self.table_path = table_path
+        self.days = index['days']
+        self.horizons = tuple(index['horizons'])
+        self.entries = {tuple(entry['key']): entry for entry in index['models'].values()}
+        data_path = os.path.join(os.path.dirname(os.path.abspath(table_path)), index['data_file'])
+        # np.memmap cannot map an empty file
+        if os.path.getsize(data_path):
+            self.values = np.memmap(data_path, dtype=np.float64, mode='r').reshape(-1, len(TABLE_COLUMNS))
+        else:
+            self.values = np.zeros((0, len(TABLE_COLUMNS)))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, model_key):
+        return model_key in self.entries
+
+    def lookup(self, model_key, days, interval, fingerprint):
+        """
+        Returns (future forecast DataFrame, info) for the next `days` days of model_key, like
+        app.get_forecast, or None when the table cannot answer: the model is not stored or its
+        file changed since the table was built (fingerprint differs), `days` is past the stored
+        horizon, or `interval` is neither 'auto', the stored method nor 'none'.
+        """
+        entry = self.entries.get(model_key)
+        if entry is None or entry['fingerprint'] != fingerprint or days > self.days:
+            return None
+        if interval not in ('auto', 'none', entry['interval_method']):
+            return None
+
+        rows = self.values[entry['row']:entry['row'] + days]
+        dates = np.datetime64(entry['first_date'], 'D') + np.arange(days)
+        columns = {'ds': dates.astype('datetime64[ns]'), 'yhat': rows[:, 0]}
+        if interval != 'none':
+            columns.update({'yhat_lower': rows[:, 1], 'yhat_upper': rows[:, 2]})
+        info = {"model_type": entry['model_type'], "interval_method": 'none' if interval == 'none' else entry['interval_method']}
+        return pd.DataFrame(columns), info
+
+
+# --- Build the table ---
+# Run after train_models.py; the API picks up the new table on its next request.
+# Usage: python forecast_table.py [model_dir] [--horizons 7,14,30] [--workers N]
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompute the forecasts of every model for the standard horizons.")
+    parser.add_argument('model_dir', nargs='?', default='.', help="Directory of the trained models (default: .)")
+    parser.add_argument('--horizons', default=','.join(map(str, TABLE_HORIZONS)),
+                        help=f"Comma-separated horizons in days (default: {','.join(map(str, TABLE_HORIZONS))})")
+    parser.add_argument('--workers', type=int, help="Number of processes (default: number of cores)")
+    parser.add_argument('--output', help=f"Table index to write (default: model_dir/{FORECAST_TABLE_FILENAME})")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    horizons = tuple(sorted(int(h) for h in args.horizons.split(',')))
+    count = build_forecast_table(args.model_dir, args.output, horizons, args.workers)
+    print(f"Precomputed {max(horizons)}-day forecasts of {count} models in {time.perf_counter() - started:.1f}s")
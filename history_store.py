@@ -0,0 +1,188 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+from forecast_cache import model_fingerprint
+
+# --- Configuration ---
+HISTORY_DB_FILENAME = 'price_history.sqlite'
+HISTORY_FREQUENCIES = ('daily', 'weekly', 'monthly')
+HISTORY_KEY_COLUMNS = ('commodity', 'state', 'district', 'market')
+INSERT_BATCH_ROWS = 50_000
+
+# One row per market and day, clustered on (market key, date): a WITHOUT ROWID table is
+# stored as its primary key's B-tree, so a market's date range is one contiguous scan
+# however many markets and days the store holds. The markets table lists what is stored
+# without scanning the prices.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    commodity TEXT NOT NULL,
+    state TEXT NOT NULL,
+    district TEXT NOT NULL,
+    market TEXT NOT NULL,
+    date TEXT NOT NULL,
+    min_price REAL,
+    max_price REAL,
+    modal_price REAL NOT NULL,
+    rows INTEGER NOT NULL,
+    PRIMARY KEY (commodity, state, district, market, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS markets (
+    commodity TEXT NOT NULL,
+    state TEXT NOT NULL,
+    district TEXT NOT NULL,
+    market TEXT NOT NULL,
+    first_date TEXT NOT NULL,
+    last_date TEXT NOT NULL,
+    days INTEGER NOT NULL,
+    PRIMARY KEY (commodity, state, district, market)
+) WITHOUT ROWID;
+"""
+
+# SQL expression of the first day of each bucket; weeks start on Monday
+BUCKET_EXPRESSIONS = {
+    'daily': "date",
+    'weekly': "date(date, '-6 days', 'weekday 1')",
+    'monthly': "substr(date, 1, 8) || '01'",
+}
+
+
+def history_key(model_key):
+    """
+    Returns a (commodity, state, district, market) key in the form model keys are parsed
+    from filenames (see model_registry.parse_model_filename), so /history and /predict
+    accept the same values.
+    """
+    return tuple(str(part).replace('_', ' ').replace('/', ' ').replace('\\', ' ').strip().title() for part in model_key)
+
+
+def build_history_store(daily, db_path=HISTORY_DB_FILENAME):
+    """
+    Writes a daily series (one row per market and day, as price_aggregation.aggregate_daily
+    returns it) into the SQLite store at db_path, creating it if needed. Days already stored
+    for a market are replaced, so re-ingesting overlapping files is safe.
+    Returns the number of rows written.
+    """
+    daily = daily[~daily['Filled']] if 'Filled' in daily.columns else daily
+    keys = [history_key(key) for key in zip(daily['Commodity'], daily['State'], daily['District'], daily['Market'])]
+    dates = daily['Date'].dt.strftime('%Y-%m-%d')
+    rows = list(zip(
+        (key[0] for key in keys), (key[1] for key in keys), (key[2] for key in keys), (key[3] for key in keys),
+        dates, daily['Min_Price_Rs'].astype(float), daily['Max_Price_Rs'].astype(float),
+        daily['Modal_Price_Rs'].astype(float), daily['Rows'].astype(int),
+    ))
+
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(SCHEMA)
+        for start in range(0, len(rows), INSERT_BATCH_ROWS):
+            conn.executemany("INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             rows[start:start + INSERT_BATCH_ROWS])
+        # Refresh the summaries of the markets just written, each from its own index range
+        for key in set(keys):
+            conn.execute("""
+                INSERT OR REPLACE INTO markets
+                SELECT commodity, state, district, market, MIN(date), MAX(date), COUNT(*) FROM prices
+                WHERE commodity = ? AND state = ? AND district = ? AND market = ?
+            """, key)
+    return len(rows)
+
+
+class HistoryStore:
+    """
+    Read-only queries on a store written by build_history_store.
+
+    Each thread gets its own connection, as sqlite3 connections cannot be shared between
+    threads. The list of markets is read once per change of the database file.
+    """
+
+    def __init__(self, db_path=HISTORY_DB_FILENAME):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(f"No price history store found at '{db_path}'.")
+        self.db_path = db_path
+        self._local = threading.local()
+        self._markets = (None, {}) # (file fingerprint, {key: (first_date, last_date, days)})
+        self._lock = threading.Lock()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        return conn
+
+    def fingerprint(self):
+        """
+        Changes whenever the store is rebuilt or re-ingested; used for ETags.
+        """
+        return model_fingerprint(self.db_path)
+
+    def markets(self):
+        """
+        Returns {key: (first_date, last_date, days)} for every stored market.
+        """
+        fingerprint, markets = self._markets
+        if fingerprint != self.fingerprint():
+            with self._lock:
+                fingerprint = self.fingerprint()
+                rows = self.connection().execute(
+                    "SELECT commodity, state, district, market, first_date, last_date, days FROM markets"
+                ).fetchall()
+                markets = {tuple(row[:4]): tuple(row[4:]) for row in rows}
+                self._markets = (fingerprint, markets)
+        return markets
+
+    def matching_keys(self, filters):
+        """
+        Returns the sorted keys of the stored markets matching `filters`, one list of accepted
+        values (or None for any) per field of HISTORY_KEY_COLUMNS.
+        """
+        return sorted(
+            key for key in self.markets()
+            if all(values is None or part in values for part, values in zip(key, filters))
+        )
+
+    def series(self, key, start=None, end=None, freq='daily'):
+        """
+        Returns one market's prices between start and end (inclusive 'YYYY-MM-DD' strings, open
+        when None) as columns: date, min_price, max_price and modal_price, plus the number of
+        trading days per bucket for weekly and monthly series. Aggregates average the daily
+        modal prices and take the bucket's lowest minimum and highest maximum.
+        """
+        if freq not in BUCKET_EXPRESSIONS:
+            raise ValueError(f"Unknown frequency '{freq}'; expected one of {HISTORY_FREQUENCIES}.")
+        where = "commodity = ? AND state = ? AND district = ? AND market = ? AND date >= ? AND date <= ?"
+        params = tuple(key) + (start or '0000-00-00', end or '9999-99-99')
+        if freq == 'daily':
+            rows = self.connection().execute(
+                f"SELECT date, min_price, max_price, modal_price FROM prices WHERE {where} ORDER BY date", params
+            ).fetchall()
+            names = ('date', 'min_price', 'max_price', 'modal_price')
+        else:
+            bucket = BUCKET_EXPRESSIONS[freq]
+            rows = self.connection().execute(f"""
+                SELECT {bucket} AS bucket, MIN(min_price), MAX(max_price), ROUND(AVG(modal_price), 2), COUNT(*)
+                FROM prices WHERE {where} GROUP BY bucket ORDER BY bucket
+            """, params).fetchall()
+            names = ('date', 'min_price', 'max_price', 'modal_price', 'days')
+        columns = list(zip(*rows)) if rows else [() for _ in names]
+        return {name: list(values) for name, values in zip(names, columns)}
+
+
+# --- Build the store ---
+# Usage: python history_store.py cleaned_historical_agmarknet_data_mp_ratlam.csv --state "Madhya Pradesh"
+if __name__ == '__main__':
+    from train_models import DEFAULT_AGGREGATE, load_daily_series # Imports Prophet; only needed to build
+
+    parser = argparse.ArgumentParser(description="Load price files into the SQLite store behind /history.")
+    parser.add_argument('files', nargs='+', help="Price CSV files (raw or cleaned) or Parquet dataset directories")
+    parser.add_argument('--state', help="State to use for files without a State column")
+    parser.add_argument('--db', default=HISTORY_DB_FILENAME, help=f"Store to create or update (default: {HISTORY_DB_FILENAME})")
+    parser.add_argument('--aggregate', default=DEFAULT_AGGREGATE,
+                        help=f"How same-day rows are combined into one price (default: {DEFAULT_AGGREGATE})")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    daily = load_daily_series(args.files, args.state, aggregate=args.aggregate, cache_dir=None)
+    written = build_history_store(daily, args.db)
+    print(f"Stored {written} market-days in {args.db} in {time.perf_counter() - started:.1f}s")
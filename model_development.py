@@ -87,4 +87,18 @@ import joblib # A library to save and load Python objects
 model_filename = 'prophet_model_Wheat_Uttar Pradesh_Varansi_Varansi.pkl'
 #model_filename = 'prophet_model_Wheat_Madhya Pradesh_Ratlam_Ratlam.pkl'
 joblib.dump(m, model_filename)
-print(f"\nProphet model saved to {model_filename}")
\ No newline at end of file
+print(f"\nProphet model saved to {model_filename}")
+
+# --- Export the compact, forecast-only artifact served by app.py ---
+from compact_model import export_compact_model
+from forecast_engine import YHAT_TOLERANCE, max_yhat_difference
+
+# Check the serving engine reproduces this model's forecast before shipping it
+yhat_difference = max_yhat_difference(m, days=90)
+print(f"\nMax yhat difference between Prophet and the serving engine: {yhat_difference:.2e}")
+if yhat_difference > YHAT_TOLERANCE:
+    print("Warning: the serving engine does not reproduce this model's forecast; keeping only the .pkl.")
+else:
+    compact_filename = model_filename.replace('.pkl', '.npz')
+    export_compact_model(m, compact_filename)
+    print(f"Compact model saved to {compact_filename}")
\ No newline at end of file
@@ -0,0 +1,319 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import joblib
+
+from compact_model import COMPACT_SUFFIX, load_compact_model
+from fallback_model import FALLBACK_PREFIX, FALLBACK_SUFFIX, load_fallback_model
+from forecast_cache import model_fingerprint
+from forecast_engine import ForecastEngine
+
+MODEL_PREFIX = 'prophet_model_'
+# (prefix, suffix) of the model files, in order of preference when several exist for a key:
+# compact Prophet artifacts, pickled Prophet objects, then the fallback forecasters
+# train_models.py writes for markets with too little history for Prophet
+MODEL_FILE_TYPES = ((MODEL_PREFIX, COMPACT_SUFFIX), (MODEL_PREFIX, '.pkl'), (FALLBACK_PREFIX, FALLBACK_SUFFIX))
+
+
+def model_file_type(filename):
+    """
+    Returns the (prefix, suffix) of filename from MODEL_FILE_TYPES, or None if it is not a model file.
+    """
+    for prefix, suffix in MODEL_FILE_TYPES:
+        if filename.startswith(prefix) and filename.endswith(suffix):
+            return prefix, suffix
+    return None
+
+
+def parse_model_filename(filename):
+    """
+    Extracts the (commodity, state, district, market) key from a model filename,
+    e.g. prophet_model_Wheat_Uttar Pradesh_Varanasi_Varanasi.pkl.
+    Returns None if the filename does not follow the naming scheme.
+    """
+    file_type = model_file_type(filename)
+    if file_type is None:
+        return None
+
+    prefix, suffix = file_type
+    params_str = filename[len(prefix):-len(suffix)]
+
+    # Split by underscore. This will give parts like ['Wheat', 'Uttar', 'Pradesh', 'Varanasi', 'Varanasi']
+    parts = params_str.split('_')
+
+    # We know the structure is generally: Commodity_State(can be multi-word)_District_Market
+    # So, the last two parts are District and Market.
+    # The first part is Commodity.
+    # The parts in between form the State.
+    if len(parts) < 4: # Ensure there are enough parts to parse
+        return None
+
+    commodity_raw = parts[0]
+    market_raw = parts[-1]
+    district_raw = parts[-2]
+
+    # Reconstruct the state name by joining the middle parts
+    # This handles states like "Uttar_Pradesh" or "Madhya_Pradesh" correctly
+    # It takes all parts from index 1 up to (but not including) the last two parts.
+    state_raw = '_'.join(parts[1:-2])
+
+    # Format for display (replace underscores with spaces and title case)
+    commodity = commodity_raw.replace('_', ' ').title()
+    state = state_raw.replace('_', ' ').title()
+    district = district_raw.replace('_', ' ').title()
+    market = market_raw.replace('_', ' ').title()
+
+    return (commodity, state, district, market)
+
+
+def load_model_file(path):
+    """
+    Loads a model artifact as a ForecastEngine: a compact .npz model, or a pickled
+    Prophet object whose parameters are extracted so Prophet.predict is not needed
+    at serve time. Pickled models the engine does not support (e.g. logistic growth)
+    are returned as the Prophet object itself, and fallback artifacts as a FallbackForecaster.
+    """
+    if os.path.basename(path).startswith(FALLBACK_PREFIX):
+        return load_fallback_model(path)
+    if path.endswith(COMPACT_SUFFIX):
+        return load_compact_model(path)
+    m = joblib.load(path)
+    try:
+        return ForecastEngine.from_prophet(m)
+    except ValueError as e:
+        print(f"  Serving '{path}' with Prophet.predict: {e}")
+        return m
+
+
+class ModelRegistry:
+    """
+    Index of the trained models in a directory, loaded on first use.
+
+    Only filenames are read when the registry is built, so startup cost does not
+    grow with the number of markets. Models are deserialized on the first request
+    for their key and at most `max_resident` of them are kept in memory, evicting
+    the least recently used one.
+    `on_load(model_key, seconds)` is called after every model load, e.g. to record load times.
+    """
+
+    def __init__(self, model_dir, max_resident=32, loader=load_model_file, on_load=None):
+        self.model_dir = model_dir
+        self.max_resident = max_resident
+        self.loader = loader
+        self.on_load = on_load
+        self._index = {} # model_key -> (path, fingerprint)
+        self._index_fingerprint = None
+        self._resident = OrderedDict() # model_key -> loaded model, in LRU order
+        self._lock = threading.Lock()
+        self._load_locks = {} # model_key -> lock held while that model is being loaded
+        self.loads = 0
+        self.evictions = 0
+        self.refresh()
+
+    def scan(self):
+        """
+        Reads the model directory and returns the index it describes, {model_key: (path, fingerprint)},
+        without changing the registry.
+        """
+        index = {}
+        preference = {} # model_key -> position of its file's type in MODEL_FILE_TYPES
+        for filename in sorted(os.listdir(self.model_dir)):
+            file_type = model_file_type(filename)
+            if file_type is None:
+                continue
+            model_key = parse_model_filename(filename)
+            if model_key is None:
+                print(f"  Skipping '{filename}': filename format not recognized for parsing parameters.")
+                continue
+            rank = MODEL_FILE_TYPES.index(file_type)
+            if model_key in preference and preference[model_key] <= rank:
+                continue
+            path = os.path.join(self.model_dir, filename)
+            index[model_key] = (path, model_fingerprint(path))
+            preference[model_key] = rank
+        return index
+
+    def changed_keys(self, index):
+        """
+        Returns the keys that were added, removed or whose file changed in `index` compared to the registry.
+        """
+        current = self._index
+        return {model_key for model_key in set(index) | set(current) if index.get(model_key) != current.get(model_key)}
+
+    def refresh(self, index=None, reload_resident=False):
+        """
+        Re-scans the model directory (or applies an index from scan()) and swaps in the new index.
+        Resident models whose file disappeared or changed are dropped; with reload_resident
+        they are first loaded again from their new file, outside the lock, so requests keep
+        being served by the old model until the new one replaces it in a single step.
+        Returns the set of changed keys.
+        """
+        if index is None:
+            index = self.scan()
+        changed = self.changed_keys(index)
+
+        reloaded = {}
+        if reload_resident:
+            for model_key in changed:
+                if model_key in index and model_key in self._resident:
+                    try:
+                        started = time.perf_counter()
+                        reloaded[model_key] = self.loader(index[model_key][0])
+                        seconds = time.perf_counter() - started
+                        print(f"  Reloaded model for {model_key} in {seconds * 1000:.1f} ms")
+                        if self.on_load is not None:
+                            self.on_load(model_key, seconds)
+                    except Exception as e:
+                        print(f"  Error reloading model {model_key}, it will be loaded on its next request: {e}")
+
+        with self._lock:
+            for model_key in list(self._resident):
+                if index.get(model_key) != self._index.get(model_key):
+                    del self._resident[model_key]
+            self._index = index
+            self._index_fingerprint = hashlib.sha256(repr(sorted(index.items())).encode()).hexdigest()
+            for model_key, model in reloaded.items():
+                self._resident[model_key] = model
+                self.loads += 1
+        return changed
+
+    def keys(self):
+        return list(self._index)
+
+    def __contains__(self, model_key):
+        return model_key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def path(self, model_key):
+        return self._index[model_key][0]
+
+    def fingerprint(self, model_key):
+        return self._index[model_key][1]
+
+    def index_fingerprint(self):
+        """
+        Returns a fingerprint of the whole index, which changes whenever a model file
+        is added, removed or replaced.
+        """
+        return self._index_fingerprint
+
+    def is_resident(self, model_key):
+        return model_key in self._resident
+
+    def resident_count(self):
+        return len(self._resident)
+
+    def get(self, model_key):
+        """
+        Returns the model for model_key, loading it from disk if it is not resident.
+        Raises KeyError if no model file exists for the key.
+        """
+        return self.get_entry(model_key)[0]
+
+    def get_entry(self, model_key):
+        """
+        Returns (model, fingerprint of the file it was loaded from) for model_key, so callers
+        caching results per fingerprint never pair a new fingerprint with an old model.
+        """
+        with self._lock:
+            path, fingerprint = self._index[model_key]
+            model = self._resident.get(model_key)
+            if model is not None:
+                self._resident.move_to_end(model_key)
+                return model, fingerprint
+            load_lock = self._load_locks.setdefault(model_key, threading.Lock())
+
+        # Only one thread loads a given model; others wait and reuse its result
+        with load_lock:
+            with self._lock:
+                model = self._resident.get(model_key)
+                if model is not None and self._index.get(model_key, (None, None))[1] != fingerprint:
+                    model = None # Swapped for a newer file while we waited; load the file we looked up
+            if model is None:
+                started = time.perf_counter()
+                model = self.loader(path)
+                seconds = time.perf_counter() - started
+                print(f"  Loaded model for {model_key} in {seconds * 1000:.1f} ms")
+                if self.on_load is not None:
+                    self.on_load(model_key, seconds)
+                with self._lock:
+                    self.loads += 1
+                    # Keep it only if the file was not replaced while we were loading
+                    if self._index.get(model_key, (None, None))[1] == fingerprint:
+                        self._resident[model_key] = model
+                        while len(self._resident) > self.max_resident:
+                            self._resident.popitem(last=False)
+                            self.evictions += 1
+        return model, fingerprint
+
+    def warm_up(self, model_keys=None):
+        """
+        Loads the given models (or as many as fit, if None) ahead of the first request.
+        Unknown keys and load failures are reported and skipped.
+        """
+        if model_keys is None:
+            model_keys = self.keys()[:self.max_resident]
+        for model_key in model_keys:
+            try:
+                self.get(model_key)
+            except KeyError:
+                print(f"  Cannot warm up {model_key}: no model file found.")
+            except Exception as e:
+                print(f"  Error loading model {model_key}: {e}")
+
+
+class ModelWatcher:
+    """
+    Background thread that polls a registry's model directory and hot-swaps new, changed
+    and removed model files without restarting the process.
+
+    A change is applied once the directory looks the same on two consecutive polls, so a
+    file that is still being written is not loaded half-way. Changed models that were
+    resident are loaded again before the swap (see ModelRegistry.refresh), then
+    on_change(changed_keys) is called, e.g. to drop their cached forecasts.
+    """
+
+    def __init__(self, registry, interval_seconds=10, on_change=None):
+        self.registry = registry
+        self.interval_seconds = interval_seconds
+        self.on_change = on_change
+        self.pid = os.getpid() # Threads do not survive a fork; each worker needs its own watcher
+        self._pending = None # Last scanned index that differed from the registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='model-watcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def poll(self):
+        """
+        Scans the directory once and applies the changes that have settled. Returns the applied keys.
+        """
+        index = self.registry.scan()
+        if not self.registry.changed_keys(index):
+            self._pending = None
+            return set()
+        if index != self._pending:
+            self._pending = index # Wait for one more poll in case files are still being written
+            return set()
+        self._pending = None
+        changed = self.registry.refresh(index, reload_resident=True)
+        if changed and self.on_change is not None:
+            self.on_change(changed)
+        return changed
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"  Error watching models in '{self.registry.model_dir}': {e}")
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from forecast_cache import model_fingerprint
+from forecast_engine import ForecastEngine
+from model_registry import ModelRegistry, load_model_file
+
+# Bump this whenever the layout of the index or the data file changes.
+MODEL_STORE_VERSION = 2
+MODEL_STORE_FILENAME = 'model_store.json' # Index; the packed arrays live in a .bin file next to it
+
+ARRAY_FIELDS = ['changepoints_t', 'delta', 'beta']
+OPTIONAL_ARRAY_FIELDS = ['interval_lower_offsets', 'interval_upper_offsets'] # Stored only when the model has them
+SCALAR_FIELDS = ['y_scale', 'floor', 'start_days', 't_scale_days', 'k', 'm', 'sigma_obs', 'interval_width']
+
+
+def build_model_store(model_dir, store_path=None):
+    """
+    Packs the parameter arrays of every model in model_dir into one float64 file that
+    ModelStore memory-maps, plus a JSON index of where each model's arrays start.
+    Models that are not a ForecastEngine (served by Prophet.predict, or fallback forecasters)
+    are left out and keep loading from their file; they are listed as unsupported so the
+    store still counts as current.
+
+    The data file is named after its content hash and written before the index is replaced,
+    so a process opening the store never pairs a new index with an old data file.
+    Returns the number of models stored.
+    """
+    store_path = store_path or os.path.join(model_dir, MODEL_STORE_FILENAME)
+    registry = ModelRegistry(model_dir, max_resident=1)
+    chunks = []
+    offset = 0
+    models = {}
+    unsupported = {} # filename -> fingerprint
+    for model_key in registry.keys():
+        path = registry.path(model_key)
+        engine = load_model_file(path)
+        if not isinstance(engine, ForecastEngine):
+            unsupported[os.path.basename(path)] = registry.fingerprint(model_key)
+            continue
+        arrays = {}
+        for field in ARRAY_FIELDS + OPTIONAL_ARRAY_FIELDS:
+            if getattr(engine, field) is None:
+                continue
+            values = np.asarray(getattr(engine, field), dtype=np.float64)
+            arrays[field] = [offset, len(values)]
+            chunks.append(values)
+            offset += len(values)
+        models[os.path.basename(path)] = {
+            'key': list(model_key),
+            'fingerprint': registry.fingerprint(model_key),
+            'arrays': arrays,
+            'scalars': {field: getattr(engine, field) for field in SCALAR_FIELDS},
+            'last_history_date': str(engine.last_history_date),
+            'seasonalities': [list(seasonality) for seasonality in engine.seasonalities],
+        }
+
+    data = np.concatenate(chunks) if chunks else np.zeros(0)
+    store_dir = os.path.dirname(os.path.abspath(store_path))
+    data_file = f"{os.path.splitext(os.path.basename(store_path))[0]}-{hashlib.sha256(data.tobytes()).hexdigest()[:16]}.bin"
+    # Per-process temporary names, in case several workers build the store at once without --preload
+    tmp_path = os.path.join(store_dir, f"{data_file}.{os.getpid()}.tmp")
+    data.tofile(tmp_path)
+    os.replace(tmp_path, os.path.join(store_dir, data_file))
+
+    previous_data_file = None
+    if os.path.exists(store_path):
+        with open(store_path) as f:
+            previous_data_file = json.load(f).get('data_file')
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': MODEL_STORE_VERSION, 'data_file': data_file, 'models': models, 'unsupported': unsupported}, f)
+    os.replace(tmp_path, store_path)
+
+    # Processes that mapped the old data file keep their mapping after it is unlinked
+    if previous_data_file and previous_data_file != data_file:
+        try:
+            os.remove(os.path.join(store_dir, previous_data_file))
+        except FileNotFoundError:
+            pass
+    return len(models)
+
+
+class ModelStore:
+    """
+    Read-only view of a store written by build_model_store.
+
+    The data file is memory-mapped, so the parameter arrays of the ForecastEngines it
+    returns are views into pages shared by every process that maps the same file
+    (e.g. all gunicorn workers). Loaded in the master with `gunicorn --preload`,
+    the store and the engines built before the fork cost the workers no extra memory
+    until they are written to.
+    """
+
+    def __init__(self, store_path):
+        with open(store_path) as f:
+            index = json.load(f)
+        if index.get('version') != MODEL_STORE_VERSION:
+            raise ValueError(f"Unsupported model store version {index.get('version')} in '{store_path}'.")
+        self.store_path = store_path
+        self.models = index['models']
+        self.unsupported = index.get('unsupported', {})
+        data_path = os.path.join(os.path.dirname(os.path.abspath(store_path)), index['data_file'])
+        # np.memmap cannot map an empty file
+        self.values = np.memmap(data_path, dtype=np.float64, mode='r') if os.path.getsize(data_path) else np.zeros(0)
+
+    def __len__(self):
+        return len(self.models)
+
+    def __contains__(self, filename):
+        return filename in self.models
+
+    def engine(self, filename):
+        """
+        Builds the ForecastEngine of a stored model file, with its arrays viewing the mapped data.
+        """
+        entry = self.models[filename]
+        arrays = {field: self.values[start:start + length] for field, (start, length) in entry['arrays'].items()}
+        names, periods, orders, modes = zip(*entry['seasonalities']) if entry['seasonalities'] else ((), (), (), ())
+        return ForecastEngine(
+            last_history_date=np.datetime64(entry['last_history_date'], 'D'),
+            seasonality_names=names,
+            seasonality_periods=periods,
+            seasonality_orders=orders,
+            seasonality_modes=modes,
+            **entry['scalars'],
+            **arrays,
+        )
+
+    def load(self, path):
+        """
+        Model loader for ModelRegistry: serves the file from the store if it is stored and
+        unchanged since the store was built, and from the file itself otherwise.
+        """
+        entry = self.models.get(os.path.basename(path))
+        if entry is None or entry['fingerprint'] != model_fingerprint(path):
+            return load_model_file(path)
+        return self.engine(os.path.basename(path))
+
+
+def open_model_store(model_dir, store_path=None):
+    """
+    Opens the store of model_dir if it has been built (python model_store.py, after training).
+    It is never built here: that loads every model, which would undo the registry's lazy
+    startup and fails on a read-only model directory. Models added or changed since the store
+    was built load from their own files (see ModelStore.load).
+    Returns None if there is no usable store; models then load from their own files.
+    """
+    store_path = store_path or os.path.join(model_dir, MODEL_STORE_FILENAME)
+    if not os.path.exists(store_path):
+        print(f"No model store at {store_path}, loading model files directly. Build it with: python model_store.py {model_dir}")
+        return None
+    try:
+        store = ModelStore(store_path)
+    except (OSError, ValueError) as e: # Older layout, corrupt index or missing data file
+        print(f"Model store {store_path} unavailable, loading model files directly: {e}")
+        return None
+
+    registry = ModelRegistry(model_dir, max_resident=1) # Filenames and stats only, no model is loaded
+    stored = {filename: entry['fingerprint'] for filename, entry in store.models.items()}
+    stored.update(store.unsupported)
+    stale = sum(stored.get(os.path.basename(registry.path(key))) != registry.fingerprint(key) for key in registry.keys())
+    if stale:
+        print(f"{stale} model files changed since {store_path} was built; they load from their own files until it is rebuilt.")
+    return store
+
+
+# --- Build the store ---
+# Run after train_models.py; the API maps the store when it starts.
+# Usage: python model_store.py [model_dir]
+if __name__ == '__main__':
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else '.'
+    count = build_model_store(model_dir)
+    print(f"Stored {count} models in {os.path.join(model_dir, MODEL_STORE_FILENAME)}")
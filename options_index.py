@@ -0,0 +1,66 @@
+from itertools import product
+
+OPTION_FIELDS = ('commodity', 'state', 'district', 'market') # Order of the parts of a model key
+OPTION_LISTS = ('commodities', 'states', 'districts', 'markets') # Matching names in the /options response
+
+
+class OptionsIndex:
+    """
+    Precomputed answers for /options, built once from the registry's model keys.
+
+    Holds the commodity -> state -> district -> [markets] hierarchy and, for every
+    combination of commodity, state and district filters that matches at least one model,
+    the sorted lists of commodities, states, districts and markets, so a query is a single
+    dict lookup. Queries that also filter on market are computed on first use and kept.
+    """
+
+    def __init__(self, model_keys):
+        model_keys = sorted(set(model_keys))
+        self._model_keys = model_keys
+
+        self.hierarchy = {}
+        for commodity, state, district, market in model_keys:
+            self.hierarchy.setdefault(commodity, {}).setdefault(state, {}).setdefault(district, []).append(market)
+
+        # Each key matches the 8 filters obtained by keeping or blanking (None) its commodity,
+        # state and district; market filters are left to _compute_options
+        values_by_filter = {}
+        for model_key in model_keys:
+            for mask in product((False, True), repeat=len(OPTION_FIELDS) - 1):
+                filters = tuple(part if keep else None for part, keep in zip(model_key, mask + (False,)))
+                values = values_by_filter.setdefault(filters, tuple(set() for _ in OPTION_FIELDS))
+                for field_values, part in zip(values, model_key):
+                    field_values.add(part)
+
+        self._options = {
+            filters: {name: sorted(field_values) for name, field_values in zip(OPTION_LISTS, values)}
+            for filters, values in values_by_filter.items()
+        }
+        self._empty = {name: [] for name in OPTION_LISTS}
+
+    def __len__(self):
+        return len(self._options)
+
+    def options(self, commodity=None, state=None, district=None, market=None):
+        """
+        Returns the flat option lists of the models matching the given filters
+        (all models when no filter is given). Unknown values give empty lists.
+        """
+        filters = (commodity or None, state or None, district or None, market or None)
+        options = self._options.get(filters)
+        if options is None:
+            if filters[3] is None:
+                return self._empty # Every matching commodity/state/district filter was precomputed
+            options = self._compute_options(filters)
+            if options is not self._empty: # Unknown values are not kept, so arbitrary queries cannot grow the index
+                self._options[filters] = options # Racing threads compute the same value, so no lock is needed
+        return options
+
+    def _compute_options(self, filters):
+        matching = [
+            model_key for model_key in self._model_keys
+            if all(value is None or part == value for part, value in zip(model_key, filters))
+        ]
+        if not matching:
+            return self._empty
+        return {name: sorted(set(values)) for name, values in zip(OPTION_LISTS, zip(*matching))}
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+KEY_COLUMNS = ['Commodity', 'State', 'District', 'Market']
+AGGREGATORS = ['weighted_modal', 'median', 'envelope']
+FILL_METHODS = ['none', 'ffill', 'interpolate']
+SERIES_CACHE_DIR = '.series_cache' # Reduced series cached by cached_daily_series
+WEIGHT_COLUMN = 'Arrivals' # Used by weighted_modal when the source reports arrival quantities
+
+
+def aggregate_daily(df, how='weighted_modal', fill='none', max_gap_days=None, keys=KEY_COLUMNS):
+    """
+    Reduces raw rows (several markets' varieties and grades per day) to one observation per (key, day).
+
+    `how` picks the daily Modal_Price_Rs:
+      - 'weighted_modal': modal prices averaged with the Arrivals column as weights
+        (equal weights when the source has no arrivals)
+      - 'median': median of the modal prices
+      - 'envelope': midpoint of the day's lowest Min_Price_Rs and highest Max_Price_Rs
+    Min_Price_Rs and Max_Price_Rs are always the day's envelope.
+
+    `fill` handles days without trading inside each key's date range: 'none' keeps the gaps
+    (Prophet handles them), 'ffill' carries the last price forward and 'interpolate' draws a
+    straight line between prices; `max_gap_days` limits how many consecutive days are filled.
+    Filled rows are marked in the Filled column. Rows holds the number of raw rows per day.
+    """
+    if how not in AGGREGATORS:
+        raise ValueError(f"Unknown aggregator '{how}'; expected one of {AGGREGATORS}.")
+    if fill not in FILL_METHODS:
+        raise ValueError(f"Unknown fill method '{fill}'; expected one of {FILL_METHODS}.")
+
+    df = df.assign(Date=df['Date'].dt.normalize())
+    if how == 'weighted_modal':
+        weights = df[WEIGHT_COLUMN].fillna(0).astype(float) if WEIGHT_COLUMN in df.columns else 1.0
+        df = df.assign(_weight=weights, _weighted=df['Modal_Price_Rs'] * weights)
+
+    grouped = df.groupby(keys + ['Date'], sort=True, observed=True)
+    daily = grouped.agg(
+        Min_Price_Rs=('Min_Price_Rs', 'min'),
+        Max_Price_Rs=('Max_Price_Rs', 'max'),
+        Rows=('Modal_Price_Rs', 'size'),
+    )
+    if how == 'weighted_modal':
+        sums = grouped[['_weighted', '_weight']].sum()
+        # Days whose arrivals are all zero fall back to the plain mean
+        daily['Modal_Price_Rs'] = (sums['_weighted'] / sums['_weight']).where(
+            sums['_weight'] > 0, grouped['Modal_Price_Rs'].mean()
+        )
+    elif how == 'median':
+        daily['Modal_Price_Rs'] = grouped['Modal_Price_Rs'].median()
+    else:
+        daily['Modal_Price_Rs'] = (daily['Min_Price_Rs'] + daily['Max_Price_Rs']) / 2
+
+    daily['Filled'] = False
+    if fill != 'none' and len(daily):
+        daily = _fill_gaps(daily, fill, max_gap_days, keys)
+    return daily.reset_index()[keys + ['Date', 'Min_Price_Rs', 'Max_Price_Rs', 'Modal_Price_Rs', 'Rows', 'Filled']]
+
+
+def _fill_gaps(daily, fill, max_gap_days, keys):
+    """
+    Reindexes every key onto a continuous daily range and fills the missing days, for all keys at once.
+    """
+    dates = daily.index.get_level_values('Date')
+    spans = pd.Series(dates, index=daily.index.droplevel('Date')).groupby(level=list(range(len(keys))), sort=False)
+    starts = spans.min()
+    lengths = ((spans.max() - starts).dt.days + 1).to_numpy()
+
+    # One row per key and day: repeat each key over its range and add day offsets
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    full_dates = np.repeat(starts.to_numpy(), lengths) + offsets.astype('timedelta64[D]')
+    key_arrays = [np.repeat(starts.index.get_level_values(i).to_numpy(), lengths) for i in range(len(keys))]
+    full_index = pd.MultiIndex.from_arrays(key_arrays + [full_dates], names=keys + ['Date'])
+
+    daily = daily.reindex(full_index)
+    missing = daily['Modal_Price_Rs'].isna()
+    price_columns = ['Min_Price_Rs', 'Max_Price_Rs', 'Modal_Price_Rs']
+    if fill == 'ffill':
+        daily[price_columns] = daily[price_columns].groupby(level=list(range(len(keys))), sort=False).ffill(limit=max_gap_days)
+    else:
+        # Each key's range starts and ends on an observed day, so a linear fill never crosses keys
+        daily[price_columns] = daily[price_columns].interpolate(limit=max_gap_days, limit_area='inside')
+
+    daily['Rows'] = daily['Rows'].fillna(0).astype(int)
+    daily['Filled'] = missing & daily['Modal_Price_Rs'].notna()
+    return daily[daily['Modal_Price_Rs'].notna()]
+
+
+def sources_fingerprint(sources):
+    """
+    Fingerprints input files (or every file under input directories) by path, size and mtime.
+    """
+    entries = []
+    for source in sources:
+        paths = [source]
+        if os.path.isdir(source):
+            paths = sorted(os.path.join(root, name) for root, _, names in os.walk(source) for name in names)
+        for path in paths:
+            stat = os.stat(path)
+            entries.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    return entries
+
+
+def cached_daily_series(sources, load, cache_dir=SERIES_CACHE_DIR, tag=None, **params):
+    """
+    Returns aggregate_daily(load(), **params), reusing the reduced series cached on disk
+    for the same input files and parameters. `tag` is anything else load() depends on
+    (e.g. a default state); cache_dir=None disables the cache.
+    """
+    if cache_dir is None:
+        return aggregate_daily(load(), **params)
+
+    key_data = json.dumps({'sources': sources_fingerprint(sources), 'tag': tag, 'params': params},
+                          sort_keys=True, default=str)
+    cache_path = os.path.join(cache_dir, hashlib.sha256(key_data.encode()).hexdigest()[:24] + '.pkl')
+    if os.path.exists(cache_path):
+        return pd.read_pickle(cache_path)
+
+    daily = aggregate_daily(load(), **params)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = cache_path + '.tmp'
+    daily.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
+    return daily
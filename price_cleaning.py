@@ -0,0 +1,151 @@
+import csv
+import re
+
+import pandas as pd
+
+# --- Canonical schema shared by every script ---
+CANONICAL_COLUMNS = [
+    'State', 'District', 'Market', 'Commodity', 'Variety', 'Grade',
+    'Date', 'Min_Price_Rs', 'Max_Price_Rs', 'Modal_Price_Rs',
+]
+NAME_COLUMNS = ['State', 'District', 'Market', 'Commodity', 'Variety', 'Grade']
+PRICE_COLUMNS = ['Min_Price_Rs', 'Max_Price_Rs', 'Modal_Price_Rs']
+
+# Normalized header (see normalize_header) -> canonical column, covering the Agmarknet
+# report exports, the data.gov.in API records and our own cleaned CSVs
+HEADER_MAPPING = {
+    'state': 'State',
+    'state_name': 'State',
+    'district': 'District',
+    'district_name': 'District',
+    'market': 'Market',
+    'market_name': 'Market',
+    'commodity': 'Commodity',
+    'variety': 'Variety',
+    'grade': 'Grade',
+    'date': 'Date',
+    'price_date': 'Date',
+    'arrival_date': 'Date',
+    'min_price': 'Min_Price_Rs',
+    'min_price_rs': 'Min_Price_Rs',
+    'min_price_rsquintal': 'Min_Price_Rs',
+    'max_price': 'Max_Price_Rs',
+    'max_price_rs': 'Max_Price_Rs',
+    'max_price_rsquintal': 'Max_Price_Rs',
+    'modal_price': 'Modal_Price_Rs',
+    'modal_price_rs': 'Modal_Price_Rs',
+    'modal_price_rsquintal': 'Modal_Price_Rs',
+}
+
+# Date formats seen across the sources, tried in this order on a sample of each file:
+# cleaned CSVs (2023-01-02), Agmarknet exports (21-Jun-25 or 25-Aug-2025),
+# the API (28/08/2025) and the API CSV export (28-08-2025)
+DATE_FORMATS = ['%Y-%m-%d', '%d-%b-%y', '%d-%b-%Y', '%d %b %Y', '%d/%m/%Y', '%d-%m-%Y'] # '%d %b %Y' is how report pages show dates
+DATE_SAMPLE_SIZE = 200
+HEADER_SEARCH_ROWS = 5 # Agmarknet exports put a metadata line above the header
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def normalize_header(name):
+    """
+    Normalizes a raw column header, e.g. 'Min Price (Rs./Quintal)' -> 'min_price_rsquintal'.
+    """
+    name = str(name).strip().replace(' ', '_').lower()
+    return re.sub('[^a-z0-9_]', '', name)
+
+
+def find_header_row(file_path):
+    """
+    Returns the index of the header row: the first line naming both a date and a modal price column.
+    """
+    with open(file_path, newline='', encoding='utf-8-sig') as f:
+        for row_number, row in enumerate(csv.reader(f)):
+            if row_number >= HEADER_SEARCH_ROWS:
+                break
+            columns = {HEADER_MAPPING.get(normalize_header(cell)) for cell in row}
+            if 'Date' in columns and 'Modal_Price_Rs' in columns:
+                return row_number
+    raise ValueError(f"No header with date and modal price columns found in the first {HEADER_SEARCH_ROWS} lines of '{file_path}'.")
+
+
+def detect_date_format(values):
+    """
+    Returns the first of DATE_FORMATS that parses every value in the sample, or None to let pandas infer it.
+    """
+    sample = pd.Series(values).dropna().astype(str).str.strip()
+    sample = sample[sample != ''].head(DATE_SAMPLE_SIZE)
+    if sample.empty:
+        return None
+    for date_format in DATE_FORMATS:
+        if pd.to_datetime(sample, format=date_format, errors='coerce').notna().all():
+            return date_format
+    return None
+
+
+def canonicalize(df, date_format=None, state=None):
+    """
+    Converts a frame of raw string columns to the canonical schema in one pass per column:
+    renames the headers, strips the names, parses the dates with `date_format` (detected if None)
+    and the comma-formatted prices. `state` fills in the State column when the source has none.
+    Rows without a date or modal price are dropped.
+    """
+    renamed = {}
+    for col in df.columns:
+        canonical = HEADER_MAPPING.get(normalize_header(col))
+        if canonical and canonical not in renamed.values():
+            renamed[col] = canonical
+    df = df[list(renamed)].rename(columns=renamed).reindex(columns=CANONICAL_COLUMNS)
+
+    if state is not None:
+        df['State'] = df['State'].fillna(state)
+    for col in NAME_COLUMNS:
+        df[col] = df[col].astype('string').str.strip()
+
+    date_strings = df['Date'].astype('string').str.strip()
+    if date_format is None:
+        date_format = detect_date_format(date_strings)
+    if date_format is None:
+        df['Date'] = pd.to_datetime(date_strings, errors='coerce', dayfirst=True)
+    else:
+        df['Date'] = pd.to_datetime(date_strings, format=date_format, errors='coerce')
+
+    for col in PRICE_COLUMNS:
+        prices = df[col].astype('string').str.replace(',', '', regex=False).str.strip()
+        df[col] = pd.to_numeric(prices, errors='coerce').astype('float64')
+
+    return df.dropna(subset=['Date', 'Modal_Price_Rs']).reset_index(drop=True)
+
+
+def iter_clean_chunks(file_path, state=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Reads any of the project's price CSVs in chunks and yields each chunk in the canonical schema,
+    so files larger than memory can be processed piece by piece.
+    The header row and the date format are detected once per file.
+    """
+    header_row = find_header_row(file_path)
+    reader = pd.read_csv(
+        file_path,
+        skiprows=header_row,
+        dtype=str, # Every column is parsed explicitly by canonicalize
+        usecols=lambda col: normalize_header(col) in HEADER_MAPPING,
+        chunksize=chunksize,
+        encoding='utf-8-sig',
+    )
+    date_format = None
+    for chunk in reader:
+        if date_format is None:
+            date_column = next(col for col in chunk.columns if HEADER_MAPPING[normalize_header(col)] == 'Date')
+            date_format = detect_date_format(chunk[date_column])
+        yield canonicalize(chunk, date_format=date_format, state=state)
+
+
+def clean_file(file_path, state=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Loads a price CSV (Agmarknet export, data.gov.in export or cleaned file) in the canonical
+    schema, sorted by date.
+    """
+    chunks = list(iter_clean_chunks(file_path, state=state, chunksize=chunksize))
+    if not chunks:
+        return canonicalize(pd.DataFrame(columns=CANONICAL_COLUMNS, dtype=str))
+    df = pd.concat(chunks, ignore_index=True)
+    return df.sort_values('Date', kind='stable').reset_index(drop=True)
@@ -0,0 +1,71 @@
+import os
+
+import pandas as pd
+
+from price_cleaning import NAME_COLUMNS, canonicalize
+
+# --- Configuration ---
+DATASET_DIR = "agmarknet_dataset" # Partitioned Parquet dataset written by data_collector.py
+PARTITION_COLUMNS = ['State', 'Commodity', 'Month']
+
+API_DATE_FORMAT = '%d/%m/%Y' # arrival_date in the data.gov.in records
+# A record is identified by these; re-fetched copies of it are dropped when reading
+RECORD_KEY_COLUMNS = NAME_COLUMNS + ['Date']
+
+
+def records_to_frame(records):
+    """
+    Converts one page of API records into typed columns: parsed dates, numeric prices
+    and categorical names, plus the Month partition column. Rows without a valid date
+    or modal price are dropped.
+    """
+    # Every page gets the same canonical columns, so all files in the dataset share one schema
+    df = canonicalize(pd.DataFrame.from_records(records), date_format=API_DATE_FORMAT)
+    for col in NAME_COLUMNS:
+        df[col] = df[col].fillna('').astype('category')
+    df['Month'] = df['Date'].dt.strftime('%Y-%m')
+    return df
+
+
+def append_page(df, dataset_dir, page_id):
+    """
+    Appends a typed page to the Parquet dataset, partitioned by state, commodity and month.
+    Files are named after page_id, so writing the same page again (e.g. after a crash
+    before its checkpoint) replaces its files instead of duplicating the rows.
+    """
+    if df.empty:
+        return
+    df.to_parquet(
+        dataset_dir,
+        engine='pyarrow',
+        partition_cols=PARTITION_COLUMNS,
+        index=False,
+        basename_template=f"{page_id}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+
+def read_partitions(dataset_dir=DATASET_DIR, state=None, commodity=None, months=None, columns=None):
+    """
+    Reads only the partitions matching the given state, commodity and months (e.g. ['2025-08'])
+    from the Parquet dataset. Records fetched by more than one pull are returned once.
+    """
+    if not os.path.isdir(dataset_dir):
+        raise FileNotFoundError(f"No dataset found at '{dataset_dir}'.")
+
+    filters = []
+    if state:
+        filters.append(('State', '==', state))
+    if commodity:
+        filters.append(('Commodity', '==', commodity))
+    if months:
+        filters.append(('Month', 'in', list(months)))
+    if columns is not None:
+        columns = list(dict.fromkeys(list(columns) + [col for col in RECORD_KEY_COLUMNS]))
+
+    df = pd.read_parquet(dataset_dir, engine='pyarrow', filters=filters or None, columns=columns)
+    for col in NAME_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(str)
+    df = df.drop_duplicates(subset=[col for col in RECORD_KEY_COLUMNS if col in df.columns], keep='last')
+    return df.sort_values('Date', kind='stable').reset_index(drop=True)
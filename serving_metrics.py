@@ -0,0 +1,124 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets in seconds, from sub-millisecond cache hits to multi-second Prophet fits
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Stage timings of the request being handled, when it asked for a profile (see timed_stage)
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+class Metrics:
+    """
+    Thread-safe counters and histograms rendered in the Prometheus text exposition format.
+
+    Labels are passed as a tuple of (name, value) pairs, e.g. (('endpoint', '/predict'),).
+    Values that already live elsewhere (cache and registry stats) are passed to render()
+    at scrape time instead of being copied here on every request.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._help = {} # name -> (type, help text)
+        self._counters = {} # (name, labels) -> value
+        self._histograms = {} # (name, labels) -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, labels=(), amount=1):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + amount
+
+    def observe(self, name, seconds, labels=()):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def render(self, gauges=()):
+        """
+        Returns all metrics as Prometheus text. `gauges` is an iterable of
+        (name, type, help text, [(labels, value), ...]) computed by the caller.
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self._histograms.items())
+
+        families = {} # name -> list of sample lines, in first-seen order
+        for (name, labels), value in counters:
+            families.setdefault(name, []).append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), (bucket_counts, total, count) in histograms:
+            lines = families.setdefault(name, [])
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', repr(bound)),))} {bucket_count}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+        output = []
+        for name, lines in families.items():
+            kind, help_text = self._help.get(name, ('untyped', ''))
+            output += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"] + lines
+        for name, kind, help_text, samples in gauges:
+            output += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            output += [f"{name}{format_labels(labels)} {value}" for labels, value in samples]
+        return '\n'.join(output) + '\n'
+
+
+def start_profile(enabled):
+    """
+    Starts collecting the current request's stage timings if enabled, otherwise stops collecting.
+    Called at the start of every request, since server threads are reused between requests.
+    """
+    _request_stages.set([] if enabled else None)
+
+
+def profile_stages():
+    """
+    Returns the [(stage, seconds), ...] recorded for the current request, or None if it is not profiled.
+    """
+    return _request_stages.get()
+
+
+@contextmanager
+def timed_stage(metrics, name, metric='crop_api_stage_seconds'):
+    """
+    Times the enclosed block into the per-stage histogram, and into the current request's
+    profile when it asked for one.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.observe(metric, seconds, (('stage', name),))
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((name, seconds))
+
+
+def server_timing(stages):
+    """
+    Formats [(stage, seconds), ...] as a Server-Timing header value (durations in milliseconds).
+    """
+    return ', '.join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in stages)
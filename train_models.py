@@ -0,0 +1,342 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import pandas as pd
+from prophet import Prophet
+
+from compact_model import export_compact_model
+from fallback_model import FALLBACK_PREFIX, FALLBACK_SUFFIX, FallbackForecaster
+from forecast_engine import YHAT_TOLERANCE, max_yhat_difference
+from model_registry import MODEL_PREFIX
+from price_aggregation import AGGREGATORS, FILL_METHODS, SERIES_CACHE_DIR, cached_daily_series
+from price_cleaning import PRICE_COLUMNS, clean_file
+from price_dataset import read_partitions
+
+# --- Configuration ---
+GROUP_COLUMNS = ['Commodity', 'State', 'District', 'Market']
+MIN_ROWS = 60 # Groups with fewer trading days get a fallback forecaster instead of a Prophet model
+DEFAULT_AGGREGATE = 'weighted_modal' # How same-day rows (varieties, grades) become one price, see price_aggregation.py
+MANIFEST_FILENAME = 'training_manifest.json' # Written next to the model artifacts
+# Same settings as the exploratory model in model_development.py
+PROPHET_KWARGS = {'seasonality_mode': 'multiplicative', 'yearly_seasonality': True, 'weekly_seasonality': True}
+
+
+def model_basename(model_key, prefix=MODEL_PREFIX):
+    """
+    Returns the artifact name (without suffix) for a (commodity, state, district, market) key,
+    in the prophet_model_<Commodity>_<State>_<District>_<Market> form app.py parses
+    (fallback_model_... with prefix=FALLBACK_PREFIX).
+    Underscores and path separators inside names would break that parsing, so they become spaces.
+    """
+    parts = [str(part).replace('_', ' ').replace('/', ' ').replace('\\', ' ').strip() for part in model_key]
+    return prefix + '_'.join(parts)
+
+
+def load_cleaned_data(file_path, state=None):
+    """
+    Loads a price CSV in any of the project's formats, or the Parquet dataset written by
+    data_collector.py, and returns the rows usable for training.
+    Agmarknet exports have no State column, so `state` fills it in when it is missing.
+    """
+    if os.path.isdir(file_path):
+        df = read_partitions(file_path, columns=GROUP_COLUMNS + ['Date'] + PRICE_COLUMNS)
+    else:
+        df = clean_file(file_path, state=state)
+
+    if df['State'].isna().any() or (df['State'] == '').any():
+        if not state:
+            raise ValueError(f"'{file_path}' has no State column; pass --state.")
+        df['State'] = df['State'].replace('', pd.NA).fillna(state)
+
+    df = df.dropna(subset=GROUP_COLUMNS + ['Date', 'Modal_Price_Rs'])
+    for col in GROUP_COLUMNS:
+        df[col] = df[col].astype(str).str.strip()
+    return df
+
+
+def series_hash(df_prophet):
+    """
+    Returns a content hash of a (ds, y) training series, used to detect groups whose data changed.
+    """
+    digest = hashlib.sha256()
+    digest.update(df_prophet['ds'].to_numpy(dtype='datetime64[ns]').tobytes())
+    digest.update(df_prophet['y'].to_numpy(dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path):
+    """
+    Loads the training manifest, or returns an empty one if it does not exist yet.
+    """
+    if not os.path.exists(manifest_path):
+        return {'version': 1, 'models': {}}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, manifest_path):
+    """
+    Writes the training manifest atomically so an interrupted run never leaves it half-written.
+    """
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def selected_prophet_kwargs(entry):
+    """
+    Returns the Prophet settings a group is trained with: the configuration backtest.py
+    selected for it, if any, and PROPHET_KWARGS otherwise.
+    """
+    if entry and entry.get('selected_config'):
+        return entry['selected_config']['prophet_kwargs']
+    return PROPHET_KWARGS
+
+
+def warm_start_params(model_path):
+    """
+    Returns the fitted parameters of a previously saved Prophet model in the form Prophet.fit
+    accepts as `init`, so Stan starts its optimisation from the last solution.
+    """
+    m = joblib.load(model_path)
+    init = {}
+    for pname in ['k', 'm', 'sigma_obs']:
+        init[pname] = float(m.params[pname][0][0])
+    for pname in ['delta', 'beta']:
+        init[pname] = m.params[pname][0]
+    return init
+
+
+def remove_files(paths):
+    """
+    Deletes the given files, skipping the ones that do not exist.
+    """
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def fit_group(model_key, df_prophet, output_dir, prophet_kwargs=None, warm_start_path=None):
+    """
+    Fits one Prophet model on a (ds, y) DataFrame and writes its .pkl and compact .npz artifacts.
+    If warm_start_path points to the previous model for this group, the fit starts from its parameters.
+    Runs inside a worker process; returns a summary dict for the report.
+    """
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING) # Stan logs every fit otherwise
+
+    init = None
+    if warm_start_path and os.path.exists(warm_start_path):
+        try:
+            init = warm_start_params(warm_start_path)
+        except Exception as e:
+            print(f"  Cannot warm-start {model_key} from '{warm_start_path}': {e}")
+
+    started = time.perf_counter()
+    m = Prophet(**(prophet_kwargs or PROPHET_KWARGS))
+    if init is not None:
+        m.fit(df_prophet, init=init) # Prophet falls back to its default init for mismatched shapes
+    else:
+        m.fit(df_prophet)
+    fit_seconds = time.perf_counter() - started
+
+    basename = os.path.join(output_dir, model_basename(model_key))
+    joblib.dump(m, basename + '.pkl')
+    files = [basename + '.pkl']
+
+    # Only ship the compact artifact if the serving engine reproduces the forecast;
+    # it also stores the intervals Prophet samples now, so serving can skip sampling
+    if max_yhat_difference(m) <= YHAT_TOLERANCE:
+        export_compact_model(m, basename + '.npz')
+        files.append(basename + '.npz')
+    else:
+        # A compact artifact left by an earlier fit would outrank the new .pkl (see model_registry.MODEL_FILE_TYPES)
+        remove_files([basename + '.npz'])
+    # The group may have been served by a fallback forecaster before
+    remove_files([os.path.join(output_dir, model_basename(model_key, FALLBACK_PREFIX) + FALLBACK_SUFFIX)])
+
+    return {'key': model_key, 'rows': len(df_prophet), 'fit_seconds': fit_seconds, 'files': files,
+            'warm_started': init is not None}
+
+
+def load_daily_series(file_paths, state=None, aggregate=DEFAULT_AGGREGATE, fill='none', max_gap_days=None,
+                      cache_dir=SERIES_CACHE_DIR):
+    """
+    Loads the given files and reduces them to one price per group and day (see aggregate_daily).
+    The reduced series is cached in cache_dir until an input file changes.
+    """
+    load = lambda: pd.concat([load_cleaned_data(path, state) for path in file_paths], ignore_index=True)
+    return cached_daily_series(file_paths, load, cache_dir=cache_dir, tag=state,
+                               how=aggregate, fill=fill, max_gap_days=max_gap_days)
+
+
+def fit_fallback_group(model_key, df_prophet, output_dir):
+    """
+    Fits a FallbackForecaster for a group with too little history for Prophet and writes
+    its artifact. Takes microseconds, so it runs in the main process.
+    Returns a summary dict like fit_group's.
+    """
+    started = time.perf_counter()
+    forecaster = FallbackForecaster.fit(df_prophet['ds'].to_numpy(), df_prophet['y'].to_numpy())
+    fit_seconds = time.perf_counter() - started
+    path = os.path.join(output_dir, model_basename(model_key, FALLBACK_PREFIX) + FALLBACK_SUFFIX)
+    forecaster.save(path)
+    # Prophet artifacts of an earlier run outrank the fallback (see model_registry.MODEL_FILE_TYPES)
+    basename = os.path.join(output_dir, model_basename(model_key))
+    remove_files([basename + '.npz', basename + '.pkl'])
+    return {'key': model_key, 'rows': len(df_prophet), 'fit_seconds': fit_seconds, 'files': [path],
+            'warm_started': False, 'model_type': 'fallback'}
+
+
+def train_all(file_paths, state=None, output_dir='.', min_rows=MIN_ROWS, workers=None, force=False,
+              aggregate=DEFAULT_AGGREGATE, fill='none', max_gap_days=None, cache_dir=SERIES_CACHE_DIR,
+              fallback=True):
+    """
+    Trains one model per (Commodity, State, District, Market) group found in the given
+    cleaned CSVs, fitting the groups in parallel on a process pool. Each group is first
+    reduced to one price per day with the `aggregate` and `fill` settings.
+    Groups with fewer than min_rows days, and groups whose Prophet fit fails, get a
+    fallback forecaster instead (see fallback_model.py) unless fallback=False.
+
+    The training manifest in output_dir records each group's content hash and last date.
+    Groups whose series and selected configuration (see backtest.py) are unchanged since
+    the last run are skipped (unless force=True), and changed groups are warm-started
+    from their previous model.
+    Returns the list of per-group summaries, including skipped and failed groups.
+    """
+    df = load_daily_series(file_paths, state, aggregate=aggregate, fill=fill, max_gap_days=max_gap_days,
+                           cache_dir=cache_dir)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    manifest = load_manifest(manifest_path)
+
+    jobs = {}
+    fallback_jobs = {}
+    series = {}
+    hashes = {}
+    prophet_kwargs = {} # model_key -> settings to fit it with
+    report = []
+    for model_key, group in df.groupby(GROUP_COLUMNS, sort=True):
+        df_prophet = group[['Date', 'Modal_Price_Rs']].rename(columns={'Date': 'ds', 'Modal_Price_Rs': 'y'})
+        df_prophet = df_prophet.reset_index(drop=True) # Already one row per day, sorted by date
+        model_type = 'prophet' if len(df_prophet) >= min_rows else 'fallback'
+        if model_type == 'fallback' and not fallback:
+            report.append({'key': model_key, 'rows': len(df_prophet), 'skipped': f"fewer than {min_rows} rows"})
+            continue
+
+        series[model_key] = df_prophet
+        hashes[model_key] = series_hash(df_prophet)
+        entry = manifest['models'].get(model_basename(model_key))
+        prophet_kwargs[model_key] = selected_prophet_kwargs(entry)
+        unchanged = (
+            entry is not None
+            and entry.get('content_hash') == hashes[model_key]
+            and entry.get('model_type', 'prophet') == model_type
+            and (model_type == 'fallback' or entry.get('prophet_kwargs', PROPHET_KWARGS) == prophet_kwargs[model_key])
+            and all(os.path.exists(path) for path in entry.get('files', []))
+        )
+        if unchanged and not force:
+            report.append({'key': model_key, 'rows': len(df_prophet), 'skipped': "unchanged since last training"})
+            continue
+        if model_type == 'fallback':
+            fallback_jobs[model_key] = df_prophet
+        else:
+            jobs[model_key] = df_prophet
+
+    def record(result):
+        # Updated in place so the backtest's selected_config is kept
+        model_key = result['key']
+        manifest['models'].setdefault(model_basename(model_key), {}).update({
+            'key': list(model_key),
+            'content_hash': hashes[model_key],
+            'last_date': series[model_key]['ds'].max().strftime('%Y-%m-%d'),
+            'rows': result['rows'],
+            'aggregate': aggregate,
+            'fill': fill,
+            'model_type': result.get('model_type', 'prophet'),
+            'prophet_kwargs': prophet_kwargs[model_key] if result.get('model_type') != 'fallback' else None,
+            'files': result['files'],
+            'fit_seconds': round(result['fit_seconds'], 6),
+            'warm_started': result['warm_started'],
+            'trained_at': datetime.now().isoformat(timespec='seconds'),
+        })
+        save_manifest(manifest, manifest_path) # Saved per model so a crash keeps finished fits
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Training {len(jobs)} models on {workers} processes ({len(report)} groups skipped)...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for model_key, df_prophet in jobs.items():
+            previous_model = os.path.join(output_dir, model_basename(model_key) + '.pkl')
+            future = executor.submit(fit_group, model_key, df_prophet, output_dir, prophet_kwargs=prophet_kwargs[model_key],
+                                     warm_start_path=previous_model)
+            futures[future] = model_key
+        for future in as_completed(futures):
+            model_key = futures[future]
+            try:
+                result = future.result()
+                warm = " (warm start)" if result['warm_started'] else ""
+                print(f"  Trained {model_key} on {result['rows']} rows in {result['fit_seconds']:.2f}s{warm}")
+            except Exception as e:
+                print(f"  Error training {model_key}: {e}")
+                if fallback:
+                    fallback_jobs[model_key] = jobs[model_key]
+                else:
+                    report.append({'key': model_key, 'rows': len(jobs[model_key]), 'error': str(e)})
+                continue
+            report.append(result)
+            record(result)
+
+    if fallback_jobs:
+        print(f"Fitting {len(fallback_jobs)} fallback forecasters...")
+    for model_key, df_prophet in fallback_jobs.items():
+        try:
+            result = fit_fallback_group(model_key, df_prophet, output_dir)
+        except Exception as e:
+            print(f"  Error fitting fallback for {model_key}: {e}")
+            report.append({'key': model_key, 'rows': len(df_prophet), 'error': str(e)})
+            continue
+        print(f"  Fallback for {model_key} on {result['rows']} rows in {result['fit_seconds'] * 1e6:.0f}us")
+        report.append(result)
+        record(result)
+
+    for result in report:
+        if 'skipped' in result:
+            print(f"  Skipped {result['key']}: {result['skipped']} ({result['rows']} rows)")
+    return report
+
+
+# --- Command line interface ---
+# Example: python train_models.py cleaned_historical_agmarknet_data_mp_ratlam.csv --state "Madhya Pradesh"
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train one Prophet model per Commodity/State/District/Market.")
+    parser.add_argument('files', nargs='+', help="Price CSV files (raw or cleaned) or Parquet dataset directories")
+    parser.add_argument('--state', help="State to use for files without a State column")
+    parser.add_argument('--output-dir', default='.', help="Where to write the model artifacts (default: .)")
+    parser.add_argument('--min-rows', type=int, default=MIN_ROWS,
+                        help=f"Groups with fewer rows get a fallback forecaster (default: {MIN_ROWS})")
+    parser.add_argument('--no-fallback', action='store_true', help="Skip groups with too few rows instead")
+    parser.add_argument('--workers', type=int, help="Number of training processes (default: number of cores)")
+    parser.add_argument('--force', action='store_true', help="Retrain groups even if their data is unchanged")
+    parser.add_argument('--aggregate', choices=AGGREGATORS, default=DEFAULT_AGGREGATE,
+                        help=f"How same-day rows are combined into one price (default: {DEFAULT_AGGREGATE})")
+    parser.add_argument('--fill', choices=FILL_METHODS, default='none', help="How days without trading are filled (default: none)")
+    parser.add_argument('--max-gap-days', type=int, help="Fill at most this many consecutive missing days")
+    parser.add_argument('--no-series-cache', action='store_true', help=f"Do not read or write the {SERIES_CACHE_DIR} cache")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    report = train_all(args.files, state=args.state, output_dir=args.output_dir,
+                       min_rows=args.min_rows, workers=args.workers, force=args.force,
+                       aggregate=args.aggregate, fill=args.fill, max_gap_days=args.max_gap_days,
+                       cache_dir=None if args.no_series_cache else SERIES_CACHE_DIR, fallback=not args.no_fallback)
+    trained = sum(1 for result in report if 'files' in result)
+    print(f"\nTrained {trained} of {len(report)} groups in {time.perf_counter() - started:.1f}s")